@@ -0,0 +1,209 @@
+import asyncio
+import os
+from collections import deque
+import stream, rs232port
+
+
+class AsyncRS232Port:
+    # asyncio side of RS232Port: the event loop watches the file descriptor of
+    # the port (loop.add_reader/add_writer), no thread and no polling, so one
+    # loop serves any number of ports
+    #   read_limit: bytes of complete lines buffered before reading pauses
+    #   write_limit: bytes waiting to be sent before write() waits for drain()
+    def __init__(self, device, errors='strict', read_limit=1 << 20, write_limit=1 << 16):
+        self.device = device
+        self.read_limit = read_limit
+        self.write_limit = write_limit
+        self._stream = device.get_stream()
+        self._fd = self._stream.fileno()
+        self._loop = asyncio.get_running_loop()
+        self._framer = stream.LineFramer(framed=True, errors=errors)
+        self._parser = None
+
+        # decoded chunks of complete lines
+        self._chunks = deque()
+        self._buffered = 0
+        self._reading = False
+        self._eof = False
+        self._error = None
+        self._waiter = None
+
+        self._write_buffer = bytearray()
+        self._writing = False
+        self._write_error = None
+        self._drain_waiter = None
+        self._closed = False
+
+        self._resume_reading()
+
+    @classmethod
+    async def open(cls, port, baudrate, **kwargs):
+        device = rs232port.RS232Port()
+        device.open(port, baudrate)
+        return cls(device, **kwargs)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._pause_reading()
+        if self._writing:
+            self._loop.remove_writer(self._fd)
+            self._writing = False
+        if self._write_buffer:
+            # data still waiting to be sent is lost: drain() raises
+            self._write_error = ConnectionResetError('the port was closed before the data was sent')
+            self._write_buffer.clear()
+        self._wake(self._drain_waiter)
+        self._set_eof()
+        self.device.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.close()
+
+    # reading
+
+    def _resume_reading(self):
+        if not self._reading and not self._eof:
+            self._loop.add_reader(self._fd, self._on_readable)
+            self._reading = True
+
+    def _pause_reading(self):
+        if self._reading:
+            self._loop.remove_reader(self._fd)
+            self._reading = False
+
+    def _on_readable(self):
+        try:
+            data = self._stream.read(max(1, self._stream.in_waiting))
+            msg = self._framer.feed(data) if data else ''
+        except (OSError, TypeError, ValueError) as err:
+            # unplugged, or not UTF-8 with errors='strict'
+            self._error = err
+            self._pause_reading()
+            self._set_eof()
+            return
+        if msg:
+            self._put(msg)
+            if self._buffered >= self.read_limit:
+                # backpressure: the kernel buffer fills up instead
+                self._pause_reading()
+
+    def _put(self, msg):
+        self._chunks.append(msg)
+        self._buffered += len(msg)
+        self._wake(self._waiter)
+
+    def _set_eof(self):
+        if self._eof:
+            return
+        self._eof = True
+        try:
+            tail = self._framer.flush()
+        except UnicodeDecodeError:
+            tail = ''
+        if tail:
+            self._put(tail)
+        self._wake(self._waiter)
+
+    @staticmethod
+    def _wake(waiter):
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    async def read_chunk(self):
+        # complete lines as one str, None at the end of the stream
+        while not self._chunks:
+            if self._eof:
+                if self._error is not None:
+                    error, self._error = self._error, None
+                    raise error
+                return None
+            self._waiter = self._loop.create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+        msg = self._chunks.popleft()
+        self._buffered -= len(msg)
+        if self._buffered < self.read_limit:
+            self._resume_reading()
+        return msg
+
+    async def lines(self):
+        while True:
+            msg = await self.read_chunk()
+            if msg is None:
+                return
+            for line in msg.replace('\r', '').split('\n'):
+                if line:
+                    yield line
+
+    async def rows(self):
+        # 2-D float arrays, like StreamParser read_floats; the parser is
+        # kept so the schema and the channel names carry over
+        if self._parser is None:
+            self._parser = stream.StreamParser()
+        while True:
+            msg = await self.read_chunk()
+            if msg is None:
+                return
+            floats = self._parser.parse_chunk(msg if msg.endswith('\n') else msg + '\n')
+            if floats is not None:
+                yield floats
+
+    @property
+    def names(self):
+        # channel names of "label:value" lines seen by rows()
+        return list(self._parser.float_parser.names) if self._parser is not None else []
+
+    # writing
+
+    async def write(self, data):
+        self._check_write()
+        if self._closed:
+            raise ConnectionResetError('the port is closed')
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self._write_buffer += data
+        self._flush_writes()
+        self._check_write()
+        if len(self._write_buffer) > self.write_limit:
+            await self.drain()
+
+    async def drain(self):
+        # waits until everything written was handed to the port
+        while self._write_buffer:
+            self._drain_waiter = self._loop.create_future()
+            try:
+                await self._drain_waiter
+            finally:
+                self._drain_waiter = None
+        self._check_write()
+
+    def _check_write(self):
+        # a failed write is raised by every later write() and drain(), the
+        # data of the failed and the following writes is not sent
+        if self._write_error is not None:
+            raise self._write_error
+
+    def _flush_writes(self):
+        try:
+            while self._write_buffer:
+                sent = os.write(self._fd, self._write_buffer)
+                del self._write_buffer[:sent]
+        except BlockingIOError:
+            if not self._writing:
+                self._loop.add_writer(self._fd, self._flush_writes)
+                self._writing = True
+            return
+        except OSError as err:
+            self._write_error = err
+            self._write_buffer.clear()
+        if self._writing:
+            self._loop.remove_writer(self._fd)
+            self._writing = False
+        self._wake(self._drain_waiter)
@@ -0,0 +1,171 @@
+import argparse, itertools, json, platform, sys, time, tracemalloc
+import numpy
+import stream, waves
+
+
+def synthetic_data(channels, count):
+    # count lines of `channels` comma separated sine values
+    t = numpy.arange(count)[:, None] * 0.01
+    values = numpy.sin(t + numpy.arange(channels)) * (numpy.arange(channels) + 1)
+    lines = [','.join(row) for row in numpy.char.mod('%.5f', values)]
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def run_reader(data, fragment_size):
+    msg = stream.StreamMessage()
+    msg.close_stream_after_read = True
+    msg.by_one_byte = True
+    msg.fragment_size = fragment_size
+    msg.set_msg(data.decode('utf-8'))
+
+    chunks = []
+    reader = stream.StreamReader()
+    reader.connect('read_message', chunks.append)
+    reader.start(msg, daemon=False)
+    return chunks
+
+
+def run_parser(chunks):
+    batches = []
+    parser = stream.StreamParser()
+    parser.connect('read_floats', batches.append)
+    for chunk in chunks:
+        parser.parse_chunk(chunk)
+    return batches
+
+
+def run_plot(batches, buffer_size, frames, width, height):
+    # rows are applied in `frames` updates, every update is drawn once
+    wave_factory = waves.WaveFactory()
+    wave_factory.buffer_size = buffer_size
+    rows = numpy.concatenate(batches)
+    renderer = waves.FrameRenderer()
+
+    update_time, frame_times = 0.0, []
+    for block in numpy.array_split(rows, frames):
+        started = time.perf_counter()
+        wave_factory.put_rows(block)
+        wave_factory.prepare_drawing_data(width)
+        update_time += time.perf_counter() - started
+
+        started = time.perf_counter()
+        renderer.render(wave_factory.frame, width, height)
+        frame_times.append(time.perf_counter() - started)
+    return update_time, frame_times
+
+
+def run_case(rate, duration, channels, buffer_size, fragment_size, fps, width, height):
+    count = int(rate * duration)
+    data = synthetic_data(channels, count)
+    frames = max(int(duration * fps), 1)
+
+    started = time.perf_counter()
+    chunks = run_reader(data, fragment_size)
+    reader_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    batches = run_parser(chunks)
+    parser_time = time.perf_counter() - started
+
+    update_time, frame_times = run_plot(batches, buffer_size, frames, width, height)
+    render_time = sum(frame_times)
+
+    total = reader_time + parser_time + update_time + render_time
+    return {
+        'rate': rate,
+        'duration': duration,
+        'channels': channels,
+        'buffer_size': buffer_size,
+        'fragment_size': fragment_size,
+        'lines': count,
+        'bytes': len(data),
+        'lines_per_s': count / total,
+        'bytes_per_s': len(data) / total,
+        # > 1: the pipeline keeps up with the simulated device
+        'realtime_factor': count / total / rate,
+        'reader_s': reader_time,
+        'parser_s': parser_time,
+        'update_s': update_time,
+        'render_s': render_time,
+        'frame_ms_mean': 1000 * render_time / len(frame_times),
+        'frame_ms_max': 1000 * max(frame_times),
+    }
+
+
+def measure_peak_memory(*args):
+    # separate run, tracemalloc slows down the timed one
+    tracemalloc.start()
+    try:
+        run_case(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def case_key(result):
+    return '{rate}/{channels}ch/{buffer_size}buf/{fragment_size}frag'.format(**result)
+
+
+def print_results(results, baseline=None):
+    previous = {}
+    if baseline is not None:
+        previous = {case_key(result): result for result in baseline['results']}
+
+    print('{:<32} {:>12} {:>12} {:>8} {:>8} {:>8} {:>8} {:>9} {:>10}'.format(
+        'case', 'lines/s', 'bytes/s', 'read s', 'parse s', 'update s', 'frame ms', 'peak MiB', 'vs base'))
+    for result in results:
+        base = previous.get(case_key(result))
+        ratio = '{:.2f}x'.format(result['lines_per_s'] / base['lines_per_s']) if base else '-'
+        print('{:<32} {:>12.0f} {:>12.0f} {:>8.3f} {:>8.3f} {:>8.3f} {:>8.2f} {:>9.1f} {:>10}'.format(
+            case_key(result), result['lines_per_s'], result['bytes_per_s'],
+            result['reader_s'], result['parser_s'], result['update_s'],
+            result['frame_ms_mean'], result.get('peak_memory', 0) / (1 << 20), ratio))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Throughput of the stream/parse/plot pipeline')
+    parser.add_argument('--rates', type=int, nargs='+', default=[1000, 10000],
+                        help='simulated lines per second')
+    parser.add_argument('--duration', type=float, default=1.0,
+                        help='simulated seconds of data per case')
+    parser.add_argument('--channels', type=int, nargs='+', default=[2, 8])
+    parser.add_argument('--buffer-sizes', type=int, nargs='+', default=[200, 100000])
+    parser.add_argument('--fragment-sizes', type=int, nargs='+', default=[64, 4096],
+                        help='bytes returned by one read of the stream')
+    parser.add_argument('--fps', type=int, default=30, help='plot updates per simulated second')
+    parser.add_argument('--width', type=int, default=700)
+    parser.add_argument('--height', type=int, default=700)
+    parser.add_argument('--no-memory', action='store_true', help='skip the peak memory runs')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--compare', help='JSON results of a previous run to compare with')
+    args = parser.parse_args(argv)
+
+    results = []
+    for rate, channels, buffer_size, fragment_size in itertools.product(
+            args.rates, args.channels, args.buffer_sizes, args.fragment_sizes):
+        case = (rate, args.duration, channels, buffer_size, fragment_size, args.fps, args.width, args.height)
+        result = run_case(*case)
+        if not args.no_memory:
+            result['peak_memory'] = measure_peak_memory(*case)
+        results.append(result)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'numpy': numpy.__version__,
+                'platform': platform.platform(),
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'results': results,
+            }, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
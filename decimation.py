@@ -0,0 +1,58 @@
+import numpy
+
+
+def columns_of(count, columns):
+    # pixel column of every sample when count samples span the given columns
+    return numpy.arange(count) * columns // count
+
+
+# indexes of the minimum and maximum sample of every pixel column: keeps at most
+# 2 * columns points in their original order, so the envelope of the signal is
+# preserved (NaN samples are ignored)
+def min_max(y, columns):
+    count = len(y)
+    if count <= 2 * columns or columns <= 0:
+        return numpy.arange(count)
+
+    starts = numpy.searchsorted(columns_of(count, columns), numpy.arange(columns))
+    sizes = numpy.diff(numpy.append(starts, count))
+    min_y = numpy.repeat(numpy.fmin.reduceat(y, starts), sizes)
+    max_y = numpy.repeat(numpy.fmax.reduceat(y, starts), sizes)
+
+    column = numpy.repeat(numpy.arange(columns), sizes)
+    indexes = []
+    for extremum in (min_y, max_y):
+        matches = numpy.flatnonzero(y == extremum)
+        # first match in each column
+        _, first = numpy.unique(column[matches], return_index=True)
+        indexes.append(matches[first])
+    return numpy.union1d(*indexes)
+
+
+# indexes picked by Largest-Triangle-Three-Buckets downsampling
+def lttb(x, y, threshold):
+    count = len(y)
+    if count <= threshold or threshold < 3:
+        return numpy.arange(count)
+
+    # first and last points are always kept, the rest is split into buckets
+    edges = numpy.linspace(1, count - 1, threshold - 1).astype(numpy.intp)
+    indexes = numpy.empty(threshold, dtype=numpy.intp)
+    indexes[0] = 0
+    indexes[-1] = count - 1
+
+    selected = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_start, next_end = end, edges[bucket + 2] if bucket + 2 < len(edges) else count
+        avg_x = x[next_start:next_end].mean()
+        avg_y = numpy.nanmean(y[next_start:next_end])
+
+        area = numpy.abs((x[selected] - avg_x) * (y[start:end] - y[selected])
+                         - (x[selected] - x[start:end]) * (avg_y - y[selected]))
+        if numpy.isnan(area).all():
+            selected = start
+        else:
+            selected = start + numpy.nanargmax(area)
+        indexes[bucket + 1] = selected
+    return indexes
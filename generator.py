@@ -0,0 +1,140 @@
+import time
+
+WAVEFORMS = ('sine', 'square', 'triangle', 'sawtooth', 'noise')
+
+
+def waveform(name, phase):
+    import numpy
+    if name == 'sine':
+        return numpy.sin(phase)
+    if name == 'square':
+        return numpy.where(numpy.sin(phase) >= 0, 1.0, -1.0)
+    if name == 'triangle':
+        return 2 / numpy.pi * numpy.arcsin(numpy.sin(phase))
+    if name == 'sawtooth':
+        return 2 * (phase / (2 * numpy.pi) % 1) - 1
+    if name == 'noise':
+        return numpy.random.default_rng().uniform(-1, 1, len(phase))
+    raise ValueError('unknown waveform: {}'.format(name))
+
+
+def make_block(name, channels, lines, amplitude=1.0):
+    # text of `lines` lines holding exactly one period of the first channel
+    # (channel i has i + 1 periods), so the block repeats without a seam
+    import numpy
+    phase = numpy.arange(lines)[:, None] * (2 * numpy.pi / lines) * numpy.arange(1, channels + 1)
+    values = amplitude * (numpy.arange(channels) + 1) * waveform(name, phase.ravel()).reshape(phase.shape)
+    text = [','.join(row) + '\n' for row in numpy.char.mod('%.5f', values)]
+    line_ends = numpy.cumsum([len(line) for line in text])
+    return ''.join(text).encode(), line_ends
+
+
+class GeneratorStream(object):
+    # serves the precomputed block cyclically at `rate` lines per second;
+    # reads wait for the next line at most `timeout` seconds
+    def __init__(self, block, line_ends, rate, timeout=0.1):
+        self._block = memoryview(block)
+        self._line_ends = line_ends
+        self._rate = rate
+        self._timeout = timeout
+        self._started = time.monotonic()
+        # bytes of the endless stream that were read or dropped
+        self._position = 0
+        # data written to the port is echoed first
+        self._inject = bytearray()
+        # bytes lost because the reader was more than one block behind
+        self.dropped = 0
+
+    def inject(self, data):
+        self._inject += data
+
+    def _due_lines(self):
+        return int((time.monotonic() - self._started) * self._rate)
+
+    def _due_bytes(self):
+        repeats, lines = divmod(self._due_lines(), len(self._line_ends))
+        return repeats * len(self._block) + (int(self._line_ends[lines - 1]) if lines else 0)
+
+    def _waiting(self):
+        due = self._due_bytes()
+        if due - self._position > len(self._block):
+            self.dropped += due - self._position - len(self._block)
+            self._position = due - len(self._block)
+        return due - self._position
+
+    @property
+    def timeout(self):
+        # read() waits for the next line at most this long
+        return self._timeout
+
+    @property
+    def in_waiting(self):
+        return len(self._inject) + self._waiting()
+
+    def _wait(self):
+        if self._inject or self._waiting():
+            return True
+        next_line = self._started + (self._due_lines() + 1) / self._rate
+        delay = next_line - time.monotonic()
+        time.sleep(max(min(delay, self._timeout), 0))
+        return delay <= self._timeout
+
+    def read(self, size=1):
+        if not self._wait():
+            return b''
+        if self._inject:
+            data = bytes(self._inject[:size])
+            del self._inject[:size]
+            return data
+        # one contiguous slice of the block, no copy
+        offset = self._position % len(self._block)
+        count = min(size, self._waiting(), len(self._block) - offset)
+        self._position += count
+        return self._block[offset:offset + count]
+
+    def readline(self):
+        if not self._wait():
+            return b''
+        return self.read(self.in_waiting)
+
+
+class GeneratorPort:
+    # test device with the RS232Port interface: the port is the waveform,
+    # the line rate is `rate` or what the baud rate can carry
+    def __init__(self, channels=2, rate=None, frequency=1.0, amplitude=1.0):
+        self.channels = channels
+        self.rate = rate
+        self.frequency = frequency
+        self.amplitude = amplitude
+        self._stream = None
+
+    def open(self, port, baudrate):
+        rate = self.rate
+        if rate is None:
+            # 10 bits per byte, about 9 bytes per value
+            rate = int(baudrate) / 10 / (9 * self.channels)
+        lines = max(int(round(rate / self.frequency)), 2)
+        block, line_ends = make_block(port, self.channels, lines, self.amplitude)
+        self._stream = GeneratorStream(block, line_ends, rate)
+        # labels of the waves
+        self._stream.inject(','.join('{}{}'.format(port, i + 1) for i in range(self.channels)).encode() + b'\n')
+
+    def is_open(self):
+        return self._stream is not None
+
+    def write(self, msg):
+        if self._stream is not None:
+            self._stream.inject(msg.encode('utf-8'))
+
+    def get_stream(self):
+        return self._stream
+
+    def close(self):
+        self._stream = None
+
+    @staticmethod
+    def get_ports():
+        return list(WAVEFORMS)
+
+    def configure(self):
+        pass
@@ -0,0 +1,199 @@
+import signal
+import struct
+import sys
+import time
+import numpy
+import stream, rs232port, recorder
+
+# binary output: every batch of rows is a header (port index, rows, columns)
+# followed by the values as little-endian float64, row by row (NaN where a row
+# has no value); the port index is the position of the port on the command line
+BATCH = struct.Struct('<HII')
+
+
+class CsvWriter:
+    # with several ports, the first column is the port
+    def __init__(self, file, ports=(), delimiter=','):
+        self._file = file
+        self._delimiter = delimiter
+        self._prefixes = [port + delimiter for port in ports] if len(ports) > 1 else None
+
+    def header(self, names, port=0):
+        prefix = self._prefixes[port] if self._prefixes else ''
+        self._file.write(prefix + self._delimiter.join(names) + '\n')
+        self._file.flush()
+
+    def write(self, rows, port=0):
+        fmt = self._delimiter.join(['%.10g'] * rows.shape[1])
+        if self._prefixes:
+            fmt = self._prefixes[port].replace('%', '%%') + fmt
+        numpy.savetxt(self._file, rows, fmt=fmt)
+        self._file.flush()
+
+
+class BinaryWriter:
+
+    def __init__(self, file, ports=()):
+        self._file = file
+
+    def header(self, names, port=0):
+        # names are not part of the binary format
+        pass
+
+    def write(self, rows, port=0):
+        self._file.write(BATCH.pack(port, *rows.shape))
+        self._file.write(numpy.ascontiguousarray(rows, dtype='<f8').tobytes())
+        self._file.flush()
+
+
+WRITERS = {
+    'csv': CsvWriter,
+    'binary': BinaryWriter,
+}
+
+
+def _is_header(line):
+    # the first line of labels, e.g. "x,y": not a number and not named values
+    if not line.strip() or ':' in line:
+        return False
+    try:
+        [float(value) for value in line.replace(',', ' ').split()]
+    except ValueError:
+        return True
+    return False
+
+
+class HeadlessPort:
+    # parser state of one port: its own schema, channel names and header
+
+    def __init__(self, index, device, writer):
+        self.index = index
+        self.device = device
+        self.writer = writer
+        self.recorder = None
+        self.rows = 0
+        self._has_header = False
+
+        self.reader = stream.StreamReader()
+        self.parser = stream.StreamParser()
+        self.reader.connect('read_message', self.parser.parse_chunk)
+        self.reader.connect('read_error', self.on_read_error)
+        self.parser.connect('read_lines', self.on_read_lines)
+        self.parser.connect('read_channels', self.on_read_channels)
+        self.parser.connect('read_floats', self.on_read_floats)
+
+    def on_read_lines(self, lines):
+        if self._has_header or self.rows:
+            return
+        for line in lines:
+            if _is_header(line):
+                self._has_header = True
+                self.writer.header([label.strip() for label in line.replace(',', ' ').split()], self.index)
+                return
+
+    def on_read_channels(self, names):
+        self._has_header = True
+        self.writer.header(names, self.index)
+
+    def on_read_floats(self, rows):
+        self.rows += len(rows)
+        self.writer.write(rows, self.index)
+
+    @staticmethod
+    def on_read_error(err):
+        print(err, file=sys.stderr)
+
+    def stats(self):
+        # counters of the parser: malformed lines are dropped, not written
+        float_parser = self.parser.float_parser
+        return 'port {}: {} rows, {} numeric lines, {} malformed lines, {} schema changes'.format(
+            self.index, self.rows, float_parser.lines, float_parser.errors, float_parser.schema_changes)
+
+
+class HeadlessMonitor:
+    # ports -> one PortMultiplexer -> parser of every port -> writer, all in
+    # the calling thread
+
+    def __init__(self, devices, writer, record_path=None, timeout=0.1):
+        self.ports = [HeadlessPort(i, device, writer) for i, device in enumerate(devices)]
+        self.record_path = record_path
+        self.multiplexer = stream.PortMultiplexer(timeout)
+
+    @property
+    def rows(self):
+        return sum(port.rows for port in self.ports)
+
+    def _record_path(self, port):
+        path = time.strftime(self.record_path)
+        if len(self.ports) > 1:
+            path = '{}.{}'.format(path, port.index)
+        return path
+
+    def run(self):
+        try:
+            for port in self.ports:
+                read_stream = port.device.get_stream()
+                if self.record_path is not None:
+                    # a capture that cannot be opened raises OSError here
+                    session = recorder.SessionRecorder(self._record_path(port))
+                    session.start()
+                    port.recorder = session
+                    read_stream = recorder.RecordingStream(read_stream, port.recorder)
+                self.multiplexer.add(read_stream, port.reader)
+            # returns when every stream is closed or stop() is called
+            self.multiplexer.run()
+        finally:
+            for port in self.ports:
+                if port.recorder is not None:
+                    port.recorder.stop()
+                    if port.recorder.report() is not None:
+                        print(port.recorder.report(), file=sys.stderr)
+                    port.recorder = None
+
+    def stop(self, *args):
+        self.multiplexer.stop()
+
+
+def main(args):
+    devices = []
+    try:
+        if args.replay is not None:
+            # the capture goes through the same reader and parser as a port;
+            # streams without a file descriptor must not block the selector
+            device = recorder.ReplayPort(args.replay, args.speed, timeout=0)
+            device.open(args.replay, args.baudrate)
+            devices.append(device)
+            ports = [args.replay]
+        else:
+            ports = args.port
+            for port in ports:
+                device = rs232port.RS232Port()
+                device.open(port, args.baudrate)
+                devices.append(device)
+
+        binary = args.format == 'binary'
+        if args.output in (None, '-'):
+            output = sys.stdout.buffer if binary else sys.stdout
+        else:
+            output = open(args.output, 'wb' if binary else 'w')
+
+        monitor = HeadlessMonitor(devices, WRITERS[args.format](output, ports), args.record)
+        signal.signal(signal.SIGTERM, monitor.stop)
+        try:
+            monitor.run()
+        except KeyboardInterrupt:
+            pass
+        except OSError as err:
+            # e.g. the capture of --record cannot be created
+            print(err, file=sys.stderr)
+            return 1
+        finally:
+            if output not in (sys.stdout, sys.stdout.buffer):
+                output.close()
+            if args.verbose:
+                for port in monitor.ports:
+                    print(port.stats(), file=sys.stderr)
+    finally:
+        for device in devices:
+            device.close()
+    return 0
@@ -0,0 +1,124 @@
+import argparse, json, os, pty, sys, time
+from threading import Thread
+import numpy
+import rs232port, stream
+
+
+def _generate(fd, rate, duration, sent):
+    # writes "sequence,send time" lines at `rate` lines per second; all lines
+    # that are due are written at once, so the rate holds at any scheduler tick
+    started = time.monotonic()
+    seq = 0
+    while True:
+        now = time.monotonic()
+        elapsed = now - started
+        if elapsed >= duration:
+            break
+        due = int(elapsed * rate)
+        if due > seq:
+            data = ''.join('{},{:.6f}\n'.format(i, now) for i in range(seq, due)).encode()
+            os.write(fd, data)
+            sent['bytes'] += len(data)
+            seq = due
+        time.sleep(0.001)
+    sent['lines'] = seq
+
+
+def run(rate=1000, duration=2.0, baudrate=921600, idle=0.5, drain_timeout=2.0):
+    master, slave = pty.openpty()
+    port = rs232port.RS232Port()
+    port.open(os.ttyname(slave), baudrate)
+
+    received = {'lines': 0, 'bytes': 0}
+    seqs, latencies = [], []
+
+    def on_message(msg):
+        received['bytes'] += len(msg.encode('utf-8'))
+
+    def on_floats(rows):
+        now = time.monotonic()
+        received['lines'] += len(rows)
+        seqs.append(rows[:, 0])
+        latencies.append(now - rows[:, 1])
+
+    reader = stream.StreamReader(bulk=True)
+    parser = stream.StreamParser()
+    reader.connect('read_message', on_message)
+    reader.connect('read_message', parser.parse_chunk)
+    parser.connect('read_floats', on_floats)
+    reader.start(port.get_stream())
+
+    try:
+        # an idle line must not cost CPU
+        cpu = time.process_time()
+        time.sleep(idle)
+        idle_cpu = (time.process_time() - cpu) / idle
+
+        sent = {'lines': 0, 'bytes': 0}
+        cpu = time.process_time()
+        started = time.monotonic()
+        generator = Thread(target=_generate, args=(master, rate, duration, sent), daemon=True)
+        generator.start()
+        generator.join()
+
+        deadline = time.monotonic() + drain_timeout
+        while received['lines'] < sent['lines'] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        elapsed = time.monotonic() - started
+        busy_cpu = (time.process_time() - cpu) / elapsed
+    finally:
+        reader.stop()
+        reader.join()
+        port.close()
+        os.close(master)
+        os.close(slave)
+
+    seqs = numpy.concatenate(seqs) if seqs else numpy.empty(0)
+    latencies = numpy.concatenate(latencies) if latencies else numpy.zeros(1)
+    return {
+        'rate': rate,
+        'duration': duration,
+        'baudrate': baudrate,
+        'sent_lines': sent['lines'],
+        'sent_bytes': sent['bytes'],
+        'received_lines': received['lines'],
+        'received_bytes': received['bytes'],
+        'lost_lines': sent['lines'] - len(numpy.unique(seqs)),
+        'out_of_order': int(numpy.count_nonzero(numpy.diff(seqs) <= 0)),
+        'lines_per_s': received['lines'] / elapsed,
+        'bytes_per_s': received['bytes'] / elapsed,
+        'latency_ms_mean': 1000 * float(latencies.mean()),
+        'latency_ms_p99': 1000 * float(numpy.percentile(latencies, 99)),
+        'latency_ms_max': 1000 * float(latencies.max()),
+        # share of one core used by the process
+        'idle_cpu': idle_cpu,
+        'busy_cpu': busy_cpu,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='RS232Port and StreamReader over a pseudo-terminal pair')
+    parser.add_argument('--rates', type=int, nargs='+', default=[1000, 10000, 50000],
+                        help='lines per second written to the other end')
+    parser.add_argument('--duration', type=float, default=2.0)
+    parser.add_argument('--baudrate', type=int, default=921600)
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args(argv)
+
+    results = []
+    for rate in args.rates:
+        result = run(rate, args.duration, args.baudrate)
+        results.append(result)
+        print('{rate:>7} lines/s: received {received_lines}/{sent_lines}, lost {lost_lines}, '
+              '{bytes_per_s:.0f} B/s, latency mean {latency_ms_mean:.2f} ms, '
+              'p99 {latency_ms_p99:.2f} ms, cpu idle {idle_cpu:.1%} busy {busy_cpu:.1%}'.format(**result))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0 if all(result['lost_lines'] == 0 for result in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,117 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import sys
+import time
+from threading import Thread
+
+# inotify(7) events of entries that appear in or leave the watched directory
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+PORT_EVENTS = IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+
+def _inotify_watch(path):
+    # non-blocking inotify descriptor watching the directory, None when the
+    # platform has no inotify
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    if libc.inotify_add_watch(fd, os.fsencode(path), PORT_EVENTS) < 0:
+        os.close(fd)
+        return None
+    return fd
+
+
+class PortWatcher:
+    # tells on_changed(added, removed) when ports appear or disappear: the
+    # ports are listed again only when an entry of `path` (/dev) was added or
+    # removed, seen by inotify or else by polling the mtime of the directory
+    def __init__(self, list_ports, path='/dev', interval=0.5, settle=0.1, use_inotify=True):
+        self.on_changed = None
+        self.path = path
+        self.interval = interval
+        # udev creates the node and its links in several steps
+        self.settle = settle
+        self.use_inotify = use_inotify
+        self.ports = []
+        self._list_ports = list_ports
+        self._stop = False
+        self._thread = None
+
+    def start(self):
+        self._stop = False
+        self._thread = Thread(target=self._watch, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop = True
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _update(self):
+        ports = self._list_ports()
+        known = set(self.ports)
+        added = [port for port in ports if port not in known]
+        current = set(ports)
+        removed = [port for port in self.ports if port not in current]
+        self.ports = list(ports)
+        if (added or removed) and self.on_changed is not None:
+            self.on_changed(added, removed)
+
+    def _watch(self):
+        fd = _inotify_watch(self.path) if self.use_inotify else None
+        try:
+            self._update()
+            if fd is not None:
+                self._watch_inotify(fd)
+            else:
+                self._watch_mtime()
+        finally:
+            if fd is not None:
+                os.close(fd)
+
+    def _watch_inotify(self, fd):
+        while not self._stop:
+            ready, _, _ = select.select([fd], [], [], self.interval)
+            if not ready:
+                continue
+            # the events only say that something changed, the list tells what
+            while ready:
+                self._drain(fd)
+                ready, _, _ = select.select([fd], [], [], self.settle)
+            self._update()
+
+    @staticmethod
+    def _drain(fd):
+        try:
+            while os.read(fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _watch_mtime(self):
+        mtime = self._mtime()
+        while not self._stop:
+            time.sleep(self.interval)
+            current = self._mtime()
+            # no directory to watch (e.g. Windows): list the ports every time
+            if current is None or current != mtime:
+                mtime = current
+                self._update()
+
+    def _mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
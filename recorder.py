@@ -0,0 +1,314 @@
+import bisect
+import mmap
+import struct
+import time
+from threading import Thread, Event
+from collections import deque
+
+# capture file: header, then records of raw bytes as they were read
+#   header: magic, version, wall clock time and monotonic time of the start
+#   record: seconds since the start (monotonic), size, data
+MAGIC = b'RS232REC'
+VERSION = 1
+HEADER = struct.Struct('<8sHdd')
+RECORD = struct.Struct('<dI')
+
+# sidecar index (<capture>.idx): (seconds since the start, record offset)
+INDEX_MAGIC = b'RS232IDX'
+INDEX_HEADER = struct.Struct('<8sH')
+INDEX_ENTRY = struct.Struct('<dQ')
+
+
+def index_path(path):
+    return path + '.idx'
+
+
+class SessionRecorder:
+
+    def __init__(self, path, index_interval=1.0, buffer_size=1 << 20, maxlen=100000):
+        self.path = path
+        # one index entry per index_interval seconds of capture
+        self.index_interval = index_interval
+        self.buffer_size = buffer_size
+        # chunks waiting for the writer thread, newer chunks are dropped
+        self.maxlen = maxlen
+        self.recorded = 0
+        # chunks that are not in the capture: the queue was full or the
+        # writing failed (error)
+        self.dropped = 0
+        self.error = None
+        self._queue = deque()
+        self._has_data = Event()
+        self._stop = False
+        self._thread = None
+        self._start_time = 0.0
+        self._capture = None
+        self._index = None
+
+    def start(self):
+        # the files are opened by the caller: a bad path raises OSError here
+        self._capture = open(self.path, 'wb', buffering=self.buffer_size)
+        try:
+            self._index = open(index_path(self.path), 'wb')
+        except OSError:
+            self._capture.close()
+            raise
+        self._stop = False
+        self.error = None
+        self._start_time = time.monotonic()
+        self._thread = Thread(target=self._write, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop = True
+        self._has_data.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    # what is missing from the capture, None when nothing is
+    def report(self):
+        if self.error is None and not self.dropped:
+            return None
+        return 'recording of {}: {} chunks dropped{}'.format(
+            self.path, self.dropped, ', {}'.format(self.error) if self.error is not None else '')
+
+    # called by the reading thread: only takes the timestamp and queues
+    def record(self, data):
+        if not data:
+            return
+        if self.error is not None or len(self._queue) >= self.maxlen:
+            self.dropped += 1
+            return
+        self._queue.append((time.monotonic(), bytes(data)))
+        self._has_data.set()
+
+    def _write(self):
+        capture, index = self._capture, self._index
+        self._capture = self._index = None
+        try:
+            try:
+                self._write_records(capture, index)
+            finally:
+                try:
+                    capture.close()
+                finally:
+                    index.close()
+        except OSError as err:
+            # e.g. the disk is full: the rest of the session is not recorded
+            self.error = err
+            self.dropped += len(self._queue)
+            self._queue.clear()
+
+    def _write_records(self, capture, index):
+        capture.write(HEADER.pack(MAGIC, VERSION, time.time(), self._start_time))
+        index.write(INDEX_HEADER.pack(INDEX_MAGIC, VERSION))
+        offset = HEADER.size
+        next_index = None
+
+        while True:
+            self._has_data.wait()
+            self._has_data.clear()
+
+            parts = []
+            index_entries = []
+            popleft = self._queue.popleft
+            for _ in range(len(self._queue)):
+                timestamp, data = popleft()
+                timestamp -= self._start_time
+                if next_index is None or timestamp >= next_index:
+                    index_entries.append(INDEX_ENTRY.pack(timestamp, offset))
+                    next_index = timestamp + self.index_interval
+                parts.append(RECORD.pack(timestamp, len(data)))
+                parts.append(data)
+                offset += RECORD.size + len(data)
+                self.recorded += len(data)
+
+            if parts:
+                capture.write(b''.join(parts))
+            if index_entries:
+                # the index never points past the data on disk
+                capture.flush()
+                index.write(b''.join(index_entries))
+                index.flush()
+
+            if self._stop and not self._queue:
+                break
+
+
+class RecordingStream(object):
+    # wraps the stream given to StreamReader and records every byte read
+    def __init__(self, stream, recorder):
+        self._stream = stream
+        self._recorder = recorder
+
+    def readline(self):
+        data = self._stream.readline()
+        if data:
+            self._recorder.record(data)
+        return data
+
+    def read(self, size=1):
+        data = self._stream.read(size)
+        if data:
+            self._recorder.record(data)
+        return data
+
+    @property
+    def in_waiting(self):
+        return self._stream.in_waiting
+
+    def fileno(self):
+        return self._stream.fileno()
+
+    @property
+    def timeout(self):
+        return getattr(self._stream, 'timeout', None)
+
+
+class CaptureFile:
+    # read side of a capture: the file is mapped, records are memoryview slices
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.start_time, _ = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError('{} is not a capture file'.format(path))
+        self._index_times, self._index_offsets = self._read_index(index_path(path))
+
+    @staticmethod
+    def _read_index(path):
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return [], []
+        if data[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+            return [], []
+        end = len(data) - (len(data) - INDEX_HEADER.size) % INDEX_ENTRY.size
+        entries = list(INDEX_ENTRY.iter_unpack(data[INDEX_HEADER.size:end]))
+        return [entry[0] for entry in entries], [entry[1] for entry in entries]
+
+    # offset of the last indexed record at or before the timestamp
+    def seek(self, timestamp):
+        i = bisect.bisect_right(self._index_times, timestamp)
+        return self._index_offsets[i - 1] if i else HEADER.size
+
+    def records(self, offset=HEADER.size):
+        view = memoryview(self._map)
+        size = len(self._map)
+        while offset + RECORD.size <= size:
+            timestamp, length = RECORD.unpack_from(self._map, offset)
+            offset += RECORD.size
+            if offset + length > size:
+                # the recorder was stopped in the middle of a write
+                break
+            yield timestamp, view[offset:offset + length]
+            offset += length
+
+    def close(self):
+        try:
+            self._map.close()
+        except BufferError:
+            # slices are still in use, the map is closed when they are freed
+            pass
+        self._file.close()
+
+
+class ReplayStream(object):
+    # plays the records back with their recorded timing, speed times faster
+    # (0 is as fast as possible); returns None at the end like a closed stream
+    def __init__(self, capture, speed=1.0, start=0.0, timeout=0.1):
+        self._speed = speed
+        self._timeout = timeout
+        self._records = capture.records(capture.seek(start))
+        self._skip_before = start
+        self._record = None
+        self._next_record()
+        self._first_time = self._record[0] if self._record is not None else 0.0
+        self._started = time.monotonic()
+
+    def _next_record(self):
+        for timestamp, data in self._records:
+            if timestamp >= self._skip_before:
+                self._record = (timestamp, data)
+                return
+        self._record = None
+
+    def _wait(self):
+        # True when the current record is due, waits at most the timeout
+        if not self._speed:
+            return True
+        due = self._started + (self._record[0] - self._first_time) / self._speed
+        delay = due - time.monotonic()
+        if delay > 0:
+            time.sleep(min(delay, self._timeout))
+            return delay <= self._timeout
+        return True
+
+    def readline(self):
+        return self.read(len(self._record[1]) if self._record is not None else 1)
+
+    def read(self, size=1):
+        if self._record is None:
+            return None
+        if not self._wait():
+            return b''
+        timestamp, data = self._record
+        if size >= len(data):
+            self._next_record()
+            return data
+        self._record = (timestamp, data[size:])
+        return data[:size]
+
+    @property
+    def timeout(self):
+        # read() waits for the next record at most this long
+        return self._timeout if self._speed else 0
+
+    @property
+    def in_waiting(self):
+        if self._record is None:
+            return 0
+        if self._speed and time.monotonic() < self._started + (self._record[0] - self._first_time) / self._speed:
+            return 0
+        return len(self._record[1])
+
+
+class ReplayPort:
+    # drop-in for RS232Port/RS232PortMock that plays a capture file back;
+    # timeout=0 for a PortMultiplexer, whose polled streams must not block
+    def __init__(self, path, speed=1.0, timeout=0.1):
+        self.path = path
+        self.speed = speed
+        self.timeout = timeout
+        self._capture = None
+        self._stream = None
+
+    def open(self, port, baudrate):
+        self.close()
+        self._capture = CaptureFile(port or self.path)
+        self._stream = ReplayStream(self._capture, self.speed, timeout=self.timeout)
+
+    def is_open(self):
+        return self._stream is not None
+
+    def write(self, msg):
+        pass
+
+    def get_stream(self):
+        return self._stream
+
+    def close(self):
+        if self._capture is not None:
+            self._stream = None
+            self._capture.close()
+            self._capture = None
+
+    def get_ports(self):
+        return [self.path]
+
+    def configure(self):
+        pass
@@ -1,61 +1,92 @@
-import gi
-import widgets, stream, rs232port
-gi.require_version("Gtk", "3.0")
-from gi.repository import Gtk
+import argparse
+import json
+import logging
+import sys
+import time
 
 
-class RS232Monitor(Gtk.Window):
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='RS232 monitor')
+    parser.add_argument('--headless', action='store_true',
+                        help='no window: write the parsed rows of --port to --output')
+    parser.add_argument('--port', action='append',
+                        help='serial port of the headless mode, e.g. /dev/ttyUSB0; '
+                             'repeat it to read several ports (the window connects one port '
+                             'from its toolbar)')
+    parser.add_argument('--baudrate', type=int, default=9600)
+    parser.add_argument('--format', choices=('csv', 'binary'), default='csv',
+                        help='output of the headless mode')
+    parser.add_argument('--output', help='file of the headless mode (default: stdout)')
+    parser.add_argument('--record', metavar='PATH',
+                        help='record the raw session, the path may have strftime() codes')
+    parser.add_argument('--fps', type=int, default=30, help='highest refresh rate of the plot')
+    parser.add_argument('--buffer-size', type=int, default=200, metavar='POINTS',
+                        help='points of every wave on the plot')
+    parser.add_argument('--y-range', type=float, nargs=2, metavar=('MIN', 'MAX'),
+                        help='fixed Y axis of the plot (default: autoscale)')
+    parser.add_argument('--y-hysteresis', type=float, default=0.0, metavar='FRACTION',
+                        help='keep the autoscaled Y axis until the data range shrinks by this fraction')
+    parser.add_argument('--generator-rate', type=float, metavar='LINES',
+                        help='lines per second of the built-in generator (default: from the baud rate)')
+    parser.add_argument('--replay', metavar='PATH',
+                        help='play a capture of --record back instead of reading a port')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='replay speed, 2 is twice as fast, 0 as fast as possible')
+    parser.add_argument('--verbose', action='store_true',
+                        help='debug logging, and the parser counters of every port at the end of --headless')
+    parser.add_argument('--startup-time', action='store_true',
+                        help='print the import and first frame times as JSON and quit')
+    args = parser.parse_args(argv)
+    if args.verbose:
+        logging.basicConfig(level=logging.DEBUG)
 
-    def __init__(self):
-        super().__init__(title="RS232 Monitor")
-        self.connect("destroy", Gtk.main_quit)
-        self.set_default_size(1000, 600)
+    if args.buffer_size < 2:
+        parser.error('--buffer-size must be at least 2')
+    if args.y_range is not None and args.y_range[0] >= args.y_range[1]:
+        parser.error('--y-range needs MIN < MAX')
+    if not 0 <= args.y_hysteresis < 1:
+        parser.error('--y-hysteresis must be in [0, 1)')
+    if args.generator_rate is not None and args.generator_rate <= 0:
+        parser.error('--generator-rate must be positive')
+    if args.speed < 0:
+        parser.error('--speed must not be negative')
 
-        msg = stream.StreamMessage()
-        msg.by_one_byte = True
-        self.device = rs232port.RS232PortMock(msg)
+    if args.headless:
+        if args.port is None and args.replay is None:
+            parser.error('--headless needs --port or --replay')
+        if args.port is not None and args.replay is not None:
+            parser.error('--replay replaces --port')
+        # only the reader, the parser and the port: no GTK, no cairo
+        import headless
+        return headless.main(args)
+    if args.port is not None:
+        # several ports are read by the headless mode only
+        parser.error('--port needs --headless, the window connects one port from its toolbar')
 
-        self.reader = stream.StreamReader()
-        self.parser = stream.StreamParser()
+    started = time.perf_counter()
+    import window
+    from gi.repository import Gtk, GLib
+    imported = time.perf_counter()
+    monitor = window.RS232Monitor(args.record, args.fps, args.generator_rate, args.buffer_size,
+                                   args.y_range, args.y_hysteresis, args.replay, args.speed)
+    if args.startup_time:
+        def on_draw(widget, ctx):
+            # quits once the first frame is drawn
+            widget.disconnect(handler)
+            GLib.idle_add(print_startup_time)
 
-        self.display = widgets.DisplayWidget()
-        self.plotter = widgets.PlotterWidget()
-        self.connection = widgets.ConnectionWidget(self.device)
+        def print_startup_time():
+            print(json.dumps({
+                'import_ms': 1000 * (imported - started),
+                'first_frame_ms': 1000 * (time.perf_counter() - started),
+                'modules': sorted(name for name in sys.modules if '.' not in name),
+            }), flush=True)
+            Gtk.main_quit()
 
-        # reader (parser to reader)
-        self.reader.connect('read_message', self.parser.parse)
-        self.reader.connect('read_error', self.parser.parse)
-
-        self.parser.connect('read_float', self.plotter.on_read_float)
-        self.parser.connect('read_last_part', self.plotter.on_read_last_part)
-        self.parser.connect('read_all', self.plotter.on_read_all)
-
-        # for test
-        self.plotter.test_device = self.device
-
-        # connection
-        self.connection.on_connected = self.reader.start
-        self.connection.on_disconnected = self.reader.stop
-        self.connection.on_error = self.on_connection_error
-
-        box = Gtk.Box()
-        box.pack_start(self.display, True, True, 5)
-        grid = Gtk.Grid()
-        grid.attach(self.connection, 0, 0, 2, 1)
-        grid.attach(box, 0, 1, 1, 1)
-        grid.attach(self.plotter, 1, 1, 1, 1)
-        self.add(grid)
-        self.show_all()
-        self.plotter.start_drawing()
-
-    def on_connection_error(self, err):
-        # show error message on display
-        msg = stream.StreamMessage()
-        msg.close_stream_after_read = True
-        msg.set_msg(str(err) + '\n')
-        self.reader.start(msg)
+        handler = monitor.connect_after('draw', on_draw)
+    Gtk.main()
+    return 0
 
 
 if __name__ == '__main__':
-    RS232Monitor()
-    Gtk.main()
+    sys.exit(main())
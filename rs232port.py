@@ -2,8 +2,9 @@ import serial
 
 
 class RS232Port:
-    def __init__(self):
+    def __init__(self, timeout=0):
         self._device = serial.Serial()
+        self._timeout = timeout
         self.configure()
 
     def open(self, port, baudrate):
@@ -36,7 +37,7 @@ class RS232Port:
         self._device.bytesize = serial.EIGHTBITS
         self._device.parity = serial.PARITY_NONE
         self._device.stopbits = serial.STOPBITS_ONE
-        self._device.timeout = 0  # 0 Non-Block reading
+        self._device.timeout = self._timeout  # 0 Non-Block reading
         self._device.xonxoff = False  # Disable Software Flow Control
         self._device.rtscts = False  # Disable (RTS/CTS) flow Control
         self._device.dsrdtr = False  # Disable (DSR/DTR) flow Control
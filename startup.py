@@ -0,0 +1,70 @@
+import argparse, json, os, statistics, subprocess, sys, time
+
+MODULES = ['stream', 'headless', 'generator', 'recorder', 'widgets', 'window', 'waves', 'numpy', 'cairo', 'serial']
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def import_time(module):
+    # seconds to import the module in a fresh interpreter, None if it fails
+    code = 'import time; t = time.perf_counter(); import {}; print(time.perf_counter() - t)'.format(module)
+    result = subprocess.run([sys.executable, '-c', code], cwd=HERE, capture_output=True, text=True)
+    if result.returncode:
+        return None
+    return float(result.stdout)
+
+
+def first_frame(timeout=30.0):
+    # times of one window start, the process start included
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, 'rs232monitor.py', '--startup-time'],
+                            cwd=HERE, capture_output=True, text=True, timeout=timeout)
+    elapsed = time.perf_counter() - started
+    if result.returncode:
+        return None
+    times = json.loads(result.stdout.splitlines()[-1])
+    times['process_ms'] = 1000 * elapsed
+    return times
+
+
+def median(values):
+    values = [value for value in values if value is not None]
+    return statistics.median(values) if values else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Cold start: import times and time to the first frame')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--modules', nargs='+', default=MODULES)
+    parser.add_argument('--no-window', action='store_true', help='only the import times')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args(argv)
+
+    results = {'imports_ms': {}}
+    for module in args.modules:
+        seconds = median([import_time(module) for _ in range(args.repeat)])
+        results['imports_ms'][module] = None if seconds is None else 1000 * seconds
+        print('import {:<12} {}'.format(module, 'failed' if seconds is None else '{:8.1f} ms'.format(1000 * seconds)))
+
+    if not args.no_window:
+        runs = [first_frame() for _ in range(args.repeat)]
+        if not any(runs):
+            print('window: failed to start')
+        else:
+            runs = [run for run in runs if run]
+            for key in ('import_ms', 'first_frame_ms', 'process_ms'):
+                results[key] = median([run[key] for run in runs])
+            results['modules'] = runs[-1]['modules']
+            print('window: import {import_ms:.1f} ms, first frame {first_frame_ms:.1f} ms, '
+                  'process start to first frame {process_ms:.1f} ms'.format(**results))
+            print('loaded before the first frame:', ', '.join(
+                module for module in ('numpy', 'cairo', 'serial') if module in results['modules']) or '-')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,36 +1,42 @@
 # import gi
-from threading import Thread
+import codecs
+import math
+import select
+import selectors
+import sys
+import time
+from threading import Thread, Condition, RLock
 from abc import ABC
+from collections import deque
 from time import sleep
 
-# gi.require_version("Gtk", "3.0")
-from gi.repository import GObject
-
 
 class StreamMessage:
 
     def __init__(self, msg=''):
-        self._msg = list(msg)
+        self._msg = bytearray(msg.encode('utf-8'))
         self._send_part = True
-        self._msg = []
 
         self.close_stream_after_read = False
         self.by_one_byte = False
+        # bytes returned by one readline(), by_one_byte returns them as a
+        # separate message
+        self.fragment_size = 1
 
     def set_msg(self, msg):
-        self._msg += list(msg)
+        self._msg += msg.encode('utf-8')
 
     def readline(self):
         if len(self._msg):
             if self.by_one_byte:
                 if self._send_part:
                     self._send_part = False
-                    return self._msg.pop(0).encode()
+                    return self.read(self.fragment_size)
                 else:
                     self._send_part = True
                     return ''.encode()
             else:
-                return self._msg.pop(0).encode()
+                return self.read(self.fragment_size)
 
         if self.close_stream_after_read:
             # close stream
@@ -39,37 +45,115 @@ class StreamMessage:
         # sleep(0.001)
         return ''.encode()
 
+    @property
+    def in_waiting(self):
+        return len(self._msg)
+
+    def read(self, size=1):
+        if not self._msg and self.close_stream_after_read:
+            # close stream
+            return None
+        part = bytes(self._msg[:size])
+        del self._msg[:size]
+        return part
+
+
+class SignalDispatcher:
+    # hands signals over to the GLib main loop: pending calls are queued and
+    # run together from one main loop callback, at most once per interval
+    DROP_OLDEST = 'drop_oldest'
+    DROP_NEWEST = 'drop_newest'
+    # backpressure: the posting thread waits until the main loop catches up
+    # (never use it for signals posted from the main loop itself)
+    BLOCK = 'block'
+
+    def __init__(self, maxlen=10000, policy=DROP_OLDEST, interval=1 / 60):
+        self.maxlen = maxlen
+        self.policy = policy
+        self.interval = interval
+        self.dropped = 0
+        self._queue = deque()
+        self._scheduled = False
+        self._condition = Condition()
+
+    @property
+    def depth(self):
+        return len(self._queue)
+
+    def post(self, handler, args=(), kwargs=None):
+        with self._condition:
+            if len(self._queue) >= self.maxlen:
+                if self.policy == self.BLOCK:
+                    while len(self._queue) >= self.maxlen:
+                        self._condition.wait()
+                elif self.policy == self.DROP_NEWEST:
+                    self.dropped += 1
+                    return
+                else:
+                    self._queue.popleft()
+                    self.dropped += 1
+            self._queue.append((handler, args, kwargs or {}))
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self._schedule()
+
+    def _schedule(self):
+        # the GLib main loop is only needed when signals are handed over to it
+        from gi.repository import GObject
+        GObject.timeout_add(max(1, round(self.interval * 1000)), self._flush)
+
+    def _flush(self):
+        with self._condition:
+            calls, self._queue = self._queue, deque()
+            self._scheduled = False
+            self._condition.notify_all()
+        for handler, args, kwargs in calls:
+            handler(*args, **kwargs)
+        return False
+
+
+main_loop_dispatcher = SignalDispatcher()
+
 
 class StreamSignal(ABC):
 
-    _signals = {}
-    _is_gobject = False
+    signals = ()
+
+    def __init__(self):
+        # handlers of every instance: {signal: [(handler, is_gobject), ...]}
+        self._signals = {signal: [] for signal in self.signals}
+        self.dispatcher = main_loop_dispatcher
 
     def call_signal(self, signal, *args, **kwargs):
-        for sig in self._signals[signal]:
-            if self._is_gobject:
-                kwargs['property'] = GObject.PRIORITY_DEFAULT
-                GObject.idle_add(sig, *args, **kwargs)
+        for sig, is_gobject in self._signals[signal]:
+            if is_gobject:
+                self.dispatcher.post(sig, args, kwargs)
             else:
                 sig(*args, **kwargs)
 
     def connect(self, sig, handler, is_gobject = False):
-        self._is_gobject = is_gobject
-        self._signals[sig].append(handler)
+        self._signals[sig].append((handler, is_gobject))
 
 
 class StreamParser(StreamSignal):
-    _signals = {
-        'read_all': [],
-        'read_first_part': [],
-        'read_part': [],
-        'read_last_part': [],
-        'read_float': [],
-    }
+    signals = (
+        'read_all',
+        'read_first_part',
+        'read_part',
+        'read_last_part',
+        'read_float',
+        'read_lines',
+        'read_floats',
+        'read_channels',
+    )
 
     def __init__(self):
+        super(StreamParser, self).__init__()
         self._ready_for_read = True
         self._full_msg = ''
+        self._decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        self.float_parser = FloatParser()
 
     def parse(self, msg):
         _msg = msg.replace('\r', '')
@@ -81,7 +165,7 @@ class StreamParser(StreamSignal):
 
         # receive full message at one time
         if self._ready_for_read and is_end_of_msg:
-            float_value = self._convert_to_float(_msg)
+            float_value = self._parse_float(_msg)
             if float_value is not None:
                 self.call_signal('read_float', float_value)
             self.call_signal('read_all', _msg)
@@ -95,7 +179,7 @@ class StreamParser(StreamSignal):
             if not self._ready_for_read:
                 self._ready_for_read = True
 
-                float_value = self._convert_to_float(self._full_msg)
+                float_value = self._parse_float(self._full_msg)
                 if float_value is not None:
                     self.call_signal('read_float', float_value)
                 self.call_signal('read_last_part', _msg, self._full_msg)
@@ -111,59 +195,468 @@ class StreamParser(StreamSignal):
         else:
             self.call_signal('read_part', _msg, self._full_msg)
 
-    @staticmethod
-    def _convert_to_float(msg):
+    # batch mode: split every complete line of the chunk at once, send them with
+    # one read_lines signal and their numeric rows as one 2-D array (rows are
+    # padded with NaN to the widest one) with one read_floats signal
+    def parse_chunk(self, chunk):
+        if not isinstance(chunk, str):
+            chunk = self._decoder.decode(chunk)
+        lines = chunk.replace('\r', '').split('\n')
+
+        # the last item is the beginning of the next line
+        tail = lines.pop()
+        if lines:
+            lines[0] = self._full_msg + lines[0]
+            self._full_msg = tail
+        else:
+            self._full_msg += tail
+        self._ready_for_read = not self._full_msg
+        if not lines:
+            return None
+
+        # new channel names go out before the lines and values they label
+        count_channels = len(self.float_parser.names)
+        floats = self.float_parser.parse(lines)
+        self._check_channels(count_channels)
+
+        self.call_signal('read_lines', lines)
+        if floats is None:
+            return None
+        self.call_signal('read_floats', floats)
+        return floats
+
+    def _parse_float(self, msg):
+        count_channels = len(self.float_parser.names)
+        float_value = self.float_parser.parse_line(msg)
+        self._check_channels(count_channels)
+        return float_value
+
+    def _check_channels(self, count_channels):
+        if len(self.float_parser.names) != count_channels:
+            self.call_signal('read_channels', list(self.float_parser.names))
+
+
+class FloatParser:
+
+    def __init__(self):
+        # learned schema of the stream: delimiter (None for one column) and
+        # count of columns, the batch fast path is used while it holds
+        self.delimiter = None
+        self.columns = 0
+        self.schema_changes = 0
+        # counters of numeric lines and of lines that are not numbers
+        self.lines = 0
+        self.errors = 0
+        # named channels ("label:value"): index of every raw name as it comes
+        # in the line, and the stripped names in the order of appearance
+        self.names = []
+        self._channels = {}
+        self._name_indexes = {}
+
+    def parse(self, lines):
+        floats = self._parse_schema(lines)
+        if floats is not None:
+            self.lines += len(lines)
+            return floats
+
+        # slow path: line by line, learns the new schema
+        rows = [row for row in map(self.parse_line, lines) if row is not None]
+        if not rows:
+            return None
+        return rows_to_array(rows)
+
+    def parse_line(self, msg):
+        if ':' in msg:
+            return self._parse_named(msg)
+
+        delimiter = self._get_delimiter(msg)
         try:
-            float_values = []
-            split_by = None
-            if ',' in msg:
-                split_by = ','
-            elif ' ' in msg:
-                split_by = ' '
-
-            if split_by is not None:
-                for val in msg.split(split_by):
-                    float_values.append(float(val))
+            if delimiter is not None:
+                float_values = [float(val) for val in msg.split(delimiter)]
             else:
-                float_values.append(float(msg))
+                float_values = [float(msg)]
+        except ValueError:
+            if msg:
+                self.errors += 1
+            return None
+
+        if delimiter != self.delimiter or len(float_values) != self.columns:
+            self.delimiter = delimiter
+            self.columns = len(float_values)
+            self.schema_changes += 1
+        self.lines += 1
+        return float_values
+
+    def _parse_named(self, msg):
+        delimiter = self._get_delimiter(msg)
+        fields = msg.split(delimiter) if delimiter is not None else [msg]
+        try:
+            values = []
+            for field in fields:
+                name, _, value = field.partition(':')
+                values.append((name, float(value)))
+        except ValueError:
+            self.errors += 1
+            return None
 
-            return float_values
-        except:
+        float_values = [math.nan] * len(self.names)
+        for name, value in values:
+            index = self._channels.get(name)
+            if index is None:
+                index = self._add_channel(name)
+                float_values.extend([math.nan] * (len(self.names) - len(float_values)))
+            float_values[index] = value
+        self.lines += 1
+        return float_values
+
+    def _add_channel(self, name):
+        label = sys.intern(name.strip())
+        index = self._name_indexes.get(label)
+        if index is None:
+            index = len(self.names)
+            self.names.append(label)
+            self._name_indexes[label] = index
+        self._channels[sys.intern(name)] = index
+        return index
+
+    def _parse_schema(self, lines):
+        if not self.columns or '' in lines:
+            return None
+        delimiter = self.delimiter
+        text = (delimiter or '\n').join(lines)
+        if ':' in text:
+            return None
+        if delimiter is None and (',' in text or ' ' in text) or delimiter == ' ' and ',' in text:
+            return None
+        # the whole batch is split and converted by the C parser of loadtxt;
+        # a field that is not a number or a changed count of columns raises
+        # and the lines go to the slow path
+        import numpy
+        try:
+            floats = numpy.loadtxt(lines, dtype=numpy.float64, delimiter=delimiter or ',',
+                                   comments=None, ndmin=2)
+        except ValueError:
+            return None
+        if floats.shape != (len(lines), self.columns):
             return None
+        return floats
+
+    @staticmethod
+    def _get_delimiter(msg):
+        if ',' in msg:
+            return ','
+        if ' ' in msg:
+            return ' '
+        return None
+
+
+# numeric rows as one 2-D array, padded with NaN to the widest row
+def rows_to_array(rows):
+    # numpy is loaded with the first rows, not at startup
+    import numpy
+    width = max(map(len, rows))
+    if all(len(row) == width for row in rows):
+        return numpy.array(rows, dtype=numpy.float64)
+    floats = numpy.full((len(rows), width), numpy.nan)
+    for i, row in enumerate(rows):
+        floats[i, :len(row)] = row
+    return floats
+
+
+class SampleQueue:
+    # bounded hand-off between the parser thread and the plotter: deque
+    # append and popleft are atomic, so neither side takes a lock
+    DROP_OLDEST = 'drop_oldest'
+    DROP_NEWEST = 'drop_newest'
+
+    def __init__(self, maxlen=100000, policy=DROP_OLDEST):
+        self.maxlen = maxlen
+        self.policy = policy
+        self.dropped = 0
+        self.max_depth = 0
+        self._queue = deque(maxlen=maxlen if policy == self.DROP_OLDEST else None)
+
+    @property
+    def depth(self):
+        return len(self._queue)
+
+    def put(self, item):
+        self.put_many((item, ))
+
+    def put_many(self, items):
+        free = max(self.maxlen - len(self._queue), 0)
+        if len(items) > free:
+            self.dropped += len(items) - free
+            if self.policy == self.DROP_NEWEST:
+                items = items[:free]
+        # with DROP_OLDEST the deque itself discards the oldest items
+        self._queue.extend(items)
+        self.max_depth = max(self.max_depth, len(self._queue))
+
+    def drain(self):
+        popleft = self._queue.popleft
+        return [popleft() for _ in range(len(self._queue))]
+
+
+class LineFramer:
+
+    def __init__(self, framed=False, errors='strict'):
+        # framed: only complete lines are returned, the tail waits for '\n'
+        self.framed = framed
+        self._buffer = bytearray()
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors)
+
+    def feed(self, data):
+        if not self.framed:
+            return self._decoder.decode(data)
+
+        if not self._buffer and isinstance(data, bytes) and data.endswith(b'\n'):
+            # nothing pending and only complete lines: decode in place
+            return self._decoder.decode(data)
+
+        self._buffer += data
+        end = self._buffer.rfind(b'\n') + 1
+        if not end:
+            return ''
+        with memoryview(self._buffer) as view:
+            msg = self._decoder.decode(view[:end])
+        del self._buffer[:end]
+        return msg
+
+    def flush(self):
+        msg = self._decoder.decode(self._buffer, final=True)
+        self._buffer.clear()
+        return msg
+
+    def reset(self):
+        self._buffer.clear()
+        self._decoder.reset()
+
 
 class StreamReader(StreamSignal):
-    _signals = {
-        'read_message': [],
-        'read_error': [],
-    }
+    signals = (
+        'read_message',
+        'read_error',
+    )
 
-    def __init__(self):
+    def __init__(self, bulk=False, timeout=0.1, framed=False, errors='strict'):
+        super(StreamReader, self).__init__()
         self._stop = False
+        self._thread = None
+        # bulk: wait for data on the file descriptor (or the stream timeout)
+        # and read everything that is waiting, instead of polling readline()
+        self._bulk = bulk
+        self._timeout = timeout
+        # errors: 'strict' (drop the chunk, send read_error), 'replace', 'ignore'
+        self._framer = LineFramer(framed, errors)
 
     def start(self, stream, daemon=True):
         self._stop = False
+        target = self._read_stream_bulk if self._bulk else self._read_stream
         if daemon:
-            Thread(target=self._read_stream, args=(stream, ), daemon=True).start()
+            self._thread = Thread(target=target, args=(stream, ), daemon=True)
+            self._thread.start()
         else:
-            self._read_stream(stream)
+            target(stream)
 
     def stop(self):
         self._stop = True
 
+    # wait for the reading thread, e.g. before the stream is closed
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
     def _read_stream(self, stream):
         while True:
             if self._stop:
                 break
-            msg_str = ''
+            data = bytearray()
 
             for line in iter(stream.readline, b''):
                 if line is None:
                     self._stop = True
                     break
+                data += line
+            if data:
+                self.feed(data)
+        self.flush()
+
+    def _read_stream_bulk(self, stream):
+        fileno = self._get_fileno(stream)
+        while not self._stop:
+            try:
+                if fileno is not None:
+                    ready, _, _ = select.select([fileno], [], [], self._timeout)
+                    if not ready:
+                        continue
+                data = stream.read(max(1, stream.in_waiting))
+            except (OSError, TypeError, ValueError) as err:
+                # unplugged, or closed under the reader
+                self.call_signal('read_error', str(err))
+                self._stop = True
+                break
+            if data is None:
+                self._stop = True
+                break
+            if not data:
+                if fileno is None and not self._get_read_timeout(stream):
+                    # the stream does not block, don't spin on it
+                    sleep(self._timeout)
+                continue
+            self.feed(data)
+        self.flush()
+
+    # bytes read from the stream (by the reading thread or a PortMultiplexer)
+    def feed(self, data):
+        try:
+            msg_str = self._framer.feed(data)
+        except UnicodeDecodeError as err:
+            self._framer.reset()
+            self.call_signal('read_error', str(err))
+            return
+        if msg_str:
+            self.call_signal('read_message', msg_str)
+
+    def flush(self):
+        # the stream is closed: send what is left of the last line
+        try:
+            msg_str = self._framer.flush()
+        except UnicodeDecodeError as err:
+            self._framer.reset()
+            self.call_signal('read_error', str(err))
+            return
+        if msg_str:
+            self.call_signal('read_message', msg_str)
+
+    @staticmethod
+    def _get_fileno(stream):
+        try:
+            return stream.fileno()
+        except Exception:
+            return None
+
+    @staticmethod
+    def _get_read_timeout(stream):
+        # seconds a read waits for data (like serial.Serial.timeout), a
+        # stream that waits itself is not slept on again
+        return getattr(stream, 'timeout', None)
+
+
+class PortMultiplexer:
+    # one thread reads many streams: a selector waits on all their file
+    # descriptors, every stream has its own StreamReader (framing, signals)
+    # and whatever parser is connected to it; streams without a file
+    # descriptor are polled every poll_interval and must not block (e.g.
+    # GeneratorStream and ReplayStream with timeout=0); used by the headless
+    # mode, the window reads its one port with a StreamReader thread
+    def __init__(self, timeout=0.1, poll_interval=0.01):
+        self._timeout = timeout
+        self._poll_interval = poll_interval
+        self._selector = selectors.DefaultSelector()
+        # {reader: stream}
+        self._streams = {}
+        self._polled = {}
+        # {reader: file descriptor registered with the selector}
+        self._filenos = {}
+        # held while streams are read, so remove() never races a read
+        self._lock = RLock()
+        self._stop = False
+        self._thread = None
+
+    def add(self, stream, reader=None):
+        if reader is None:
+            reader = StreamReader()
+        fileno = StreamReader._get_fileno(stream)
+        with self._lock:
+            if fileno is None:
+                self._polled[reader] = stream
+            else:
+                self._selector.register(fileno, selectors.EVENT_READ, reader)
+                self._filenos[reader] = fileno
+            self._streams[reader] = stream
+        return reader
+
+    def remove(self, reader):
+        with self._lock:
+            self._remove(reader)
+
+    def _remove(self, reader):
+        stream = self._streams.pop(reader, None)
+        if stream is None:
+            return
+        self._polled.pop(reader, None)
+        # the stream may be closed already: its descriptor is the stored one
+        fileno = self._filenos.pop(reader, None)
+        if fileno is not None:
+            self._selector.unregister(fileno)
+        reader.flush()
+
+    def _remove_closed(self):
+        # a closed descriptor leaves epoll without an event, so streams are
+        # checked for a changed (None) descriptor once per timeout
+        for reader, fileno in list(self._filenos.items()):
+            if StreamReader._get_fileno(self._streams[reader]) != fileno:
+                self._remove(reader)
+
+    @property
+    def count(self):
+        return len(self._streams)
+
+    def start(self, daemon=True):
+        # reads until stop()
+        self._stop = False
+        self._thread = Thread(target=self._run, args=(False, ), daemon=daemon)
+        self._thread.start()
+
+    def run(self):
+        # reads in the calling thread until stop() or until every stream is closed
+        self._stop = False
+        self._run(True)
+
+    def stop(self):
+        self._stop = True
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self, until_closed):
+        check_closed = time.monotonic() + self._timeout
+        while not self._stop:
+            if until_closed and not self._streams:
+                break
+            timeout = self._poll_interval if self._polled else self._timeout
+            events = ()
+            if self._selector.get_map():
                 try:
-                    msg_str += line.decode('utf-8')
-                except Exception as err:
-                    self.call_signal('read_error', str(err))
-                    break
-            if msg_str:
-                self.call_signal('read_message', msg_str)
+                    events = self._selector.select(timeout)
+                except OSError:
+                    # select() on a closed descriptor (not epoll)
+                    check_closed = 0
+            else:
+                sleep(timeout)
+            with self._lock:
+                if time.monotonic() >= check_closed:
+                    check_closed = time.monotonic() + self._timeout
+                    self._remove_closed()
+                for key, _ in events:
+                    if key.data in self._streams:
+                        self._read(key.data, self._streams[key.data])
+                for reader, stream in list(self._polled.items()):
+                    self._read(reader, stream)
+        with self._lock:
+            for reader in list(self._streams):
+                self._remove(reader)
+
+    def _read(self, reader, stream):
+        try:
+            data = stream.read(max(1, stream.in_waiting))
+        except (OSError, TypeError, ValueError) as err:
+            # unplugged or closed under the reader
+            reader.call_signal('read_error', str(err))
+            data = None
+        if data is None:
+            self._remove(reader)
+        elif data:
+            reader.feed(data)
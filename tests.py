@@ -1,4 +1,9 @@
-import stream
+import os
+import tempfile
+import threading
+import time
+import numpy
+import stream, recorder, generator, portwatch
 
 def create_parser():
     parser = stream.StreamParser()
@@ -28,6 +33,37 @@ def stream_parser():
     parser.parse('\n')
 
 
+def stream_parser_chunk():
+    parser = stream.StreamParser()
+    parser.connect('read_lines', stream_parser_read_lines)
+    parser.connect('read_floats', stream_parser_read_floats)
+
+    parser.parse_chunk('x, y\n1.5,2\n2.5,3\n3.5')
+    parser.parse_chunk(b',4\n4.5\n')
+    parser.parse_chunk('5.5,6\n6.5,7\n7,x\n')
+    print('parser:float_parser(lines={}, errors={}, schema=({!r}, {}))'.format(
+        parser.float_parser.lines, parser.float_parser.errors,
+        parser.float_parser.delimiter, parser.float_parser.columns))
+
+
+def stream_parser_named():
+    parser = stream.StreamParser()
+    parser.connect('read_channels', stream_parser_read_channels)
+    parser.connect('read_floats', stream_parser_read_floats)
+
+    parser.parse_chunk('temperature:21.5,humidity:40\nhumidity:41\n')
+    parser.parse_chunk('pressure:1013,temperature:21.6\n')
+
+
+def stream_parser_read_channels(names, *args, **kwargs):
+    print('parser:read_channels(names={})'.format(names))
+
+def stream_parser_read_lines(lines, *args, **kwargs):
+    print('parser:read_lines(lines={})'.format(lines))
+
+def stream_parser_read_floats(values, *args, **kwargs):
+    print('parser:read_floats()->:', values.tolist(), values.shape)
+
 def stream_parser_read_all(msg, *args, **kwargs):
     print('parser:read_all(msg={})'.format(msg))
 
@@ -43,6 +79,38 @@ def stream_parser_read_part(msg, full_msg, *args, **kwargs):
 def stream_parser_read_last_part(msg, full_msg, *args, **kwargs):
     print('parser:read_last_part(msg={}, full_msg={})'.format(msg, full_msg))
 
+def sparse_channels():
+    import waves
+    parser = stream.StreamParser()
+    wave_factory = waves.WaveFactory()
+    wave_factory.buffer_size = 200
+    parser.connect('read_floats', wave_factory.put_rows)
+    parser.parse_chunk(''.join('temperature:{0},humidity:{0}\nhumidity:{1}\n'.format(i, i + 1)
+                               for i in range(200)))
+    wave_factory.prepare_drawing_data(700)
+    # one slot per line in every wave: the sparse wave spans the same x
+    for wave in wave_factory.frame:
+        print('waves:put_rows()->: {} points, {} NaN, x {:.3f}..{:.3f}'.format(
+            len(wave.coordinates), int(numpy.isnan(wave.coordinates).sum()),
+            wave.coordinates[0, 0], wave.coordinates[-1, 0]))
+
+def fixed_y_range():
+    import waves
+    wave_factory = waves.WaveFactory()
+    wave_factory.buffer_size = 200
+    wave_factory.y_range = (-2.0, 2.0)
+    wave_factory.put_rows(numpy.sin(numpy.linspace(0, 6, 100)).reshape(-1, 1))
+    wave_factory.prepare_drawing_data(700)
+    coordinates = wave_factory.frame[0].coordinates
+    print('waves:y_range{}->: {} points, y in [{:.2f}, {:.2f}]'.format(
+        wave_factory.y_range, len(coordinates), coordinates[:, 1].min(), coordinates[:, 1].max()))
+
+def find_peaks():
+    import waves
+    # index 1 is not a peak, like in the per-sample loop
+    positive, negative = waves.Wave._find_peaks(numpy.array([0.0, 5, 0, 3, 0, -2, 0]))
+    print('waves:_find_peaks()->:', positive.tolist(), negative.tolist())
+
 def stream_reader():
     reader = stream.StreamReader()
     reader.connect('read_message', stream_reader_read_message)
@@ -64,12 +132,261 @@ def stream_reader():
     reader.start(stream_message, daemon=False)
 
 
+def stream_reader_bulk():
+    reader = stream.StreamReader(bulk=True, timeout=0.01)
+    reader.connect('read_message', stream_reader_read_message)
+
+    stream_message = stream.StreamMessage()
+    stream_message.close_stream_after_read = True
+
+    stream_message.set_msg('read all waiting bytes at once\n')
+    reader.start(stream_message, daemon=False)
+
+def line_framer():
+    framer = stream.LineFramer(framed=True)
+    data = 'температура 21.5\nвлажность'.encode('utf-8')
+    # multi-byte characters split between reads
+    for i in range(0, len(data), 3):
+        msg = framer.feed(data[i:i + 3])
+        if msg:
+            print('framer:feed()->:', repr(msg))
+    print('framer:flush()->:', repr(framer.flush()))
+
+def sample_queue():
+    for policy in (stream.SampleQueue.DROP_OLDEST, stream.SampleQueue.DROP_NEWEST):
+        queue = stream.SampleQueue(maxlen=3, policy=policy)
+        queue.put_many([[1.0], [2.0]])
+        queue.put_many([[3.0], [4.0], [5.0]])
+        print('queue:{}(depth={}, max_depth={}, dropped={})->:'.format(
+            policy, queue.depth, queue.max_depth, queue.dropped), queue.drain())
+
+class ManualDispatcher(stream.SignalDispatcher):
+    # the test plays the main loop: _flush() is called by hand
+    def _schedule(self):
+        pass
+
+def signal_dispatcher():
+    for policy in (stream.SignalDispatcher.DROP_OLDEST, stream.SignalDispatcher.DROP_NEWEST):
+        received = []
+        dispatcher = ManualDispatcher(maxlen=3, policy=policy)
+        for value in range(5):
+            dispatcher.post(received.append, (value,))
+        depth = dispatcher.depth
+        dispatcher._flush()
+        print('dispatcher:{}(depth={}, dropped={})->:'.format(policy, depth, dispatcher.dropped), received)
+
+    # the posting thread waits for the main loop instead of dropping
+    received = []
+    dispatcher = ManualDispatcher(maxlen=2, policy=stream.SignalDispatcher.BLOCK)
+    thread = threading.Thread(target=lambda: [dispatcher.post(received.append, (value,)) for value in range(5)])
+    thread.start()
+    max_depth = 0
+    while thread.is_alive() or dispatcher.depth:
+        time.sleep(0.01)
+        max_depth = max(max_depth, dispatcher.depth)
+        dispatcher._flush()
+    thread.join()
+    print('dispatcher:{}(max_depth={}, dropped={})->:'.format(
+        dispatcher.policy, max_depth, dispatcher.dropped), received)
+
+def session_replay():
+    path = os.path.join(tempfile.mkdtemp(), 'session.rec')
+    session = recorder.SessionRecorder(path)
+    session.start()
+    for data in (b'x,y\n1,', b'2\n3,4\n', b'5,6\n'):
+        session.record(data)
+    session.stop()
+
+    parser = stream.StreamParser()
+    parser.connect('read_floats', stream_parser_read_floats)
+    reader = stream.StreamReader(bulk=True, timeout=0.01)
+    reader.connect('read_message', parser.parse_chunk)
+
+    port = recorder.ReplayPort(path, speed=0)
+    port.open(port.get_ports()[0], 0)
+    reader.start(port.get_stream(), daemon=False)
+    port.close()
+
+def session_recorder_errors():
+    # a path that cannot be created is raised by start()
+    try:
+        recorder.SessionRecorder(os.path.join(tempfile.mkdtemp(), 'missing', 'session.rec')).start()
+    except OSError as err:
+        print('recorder:start()->:', type(err).__name__)
+
+    # the writer thread is not started: chunks beyond maxlen are dropped
+    session = recorder.SessionRecorder(os.path.join(tempfile.mkdtemp(), 'session.rec'), maxlen=2)
+    for data in (b'1\n', b'2\n', b'3\n', b'4\n'):
+        session.record(data)
+    print('recorder:record()->: queued {}, dropped {}'.format(len(session._queue), session.dropped))
+
+def generator_port():
+    port = generator.GeneratorPort(channels=2, rate=1000, frequency=250)
+    port.open('triangle', 0)
+    parser = stream.StreamParser()
+    parser.connect('read_lines', stream_parser_read_lines)
+    parser.connect('read_floats', stream_parser_read_floats)
+    read_stream = port.get_stream()
+    for _ in range(3):
+        parser.parse_chunk(read_stream.read(read_stream.in_waiting or 1))
+    print('generator:dropped->:', read_stream.dropped)
+    port.close()
+
+def port_multiplexer():
+    multiplexer = stream.PortMultiplexer(timeout=0.01)
+    for text in ('temperature:21.5\n', '1,2\n3,4\n'):
+        msg = stream.StreamMessage(text)
+        msg.close_stream_after_read = True
+        parser = stream.StreamParser()
+        parser.connect('read_channels', stream_parser_read_channels)
+        parser.connect('read_floats', stream_parser_read_floats)
+        reader = multiplexer.add(msg)
+        reader.connect('read_message', parser.parse_chunk)
+    multiplexer.run()
+    print('multiplexer:run()->: streams left', multiplexer.count)
+
+def headless_monitor():
+    import sys, headless, rs232port
+    msg = stream.StreamMessage('x,y\n1,2\n3,4\n5\n')
+    msg.close_stream_after_read = True
+    monitor = headless.HeadlessMonitor([rs232port.RS232PortMock(msg)], headless.CsvWriter(sys.stdout))
+    monitor.run()
+    print('headless:run()->: rows', monitor.rows)
+    print('headless:stats()->:', monitor.ports[0].stats())
+
+def port_watcher():
+    import time
+    for use_inotify in (True, False):
+        path = tempfile.mkdtemp()
+        open(os.path.join(path, 'ttyS0'), 'w').close()
+        watcher = portwatch.PortWatcher(
+            lambda: sorted(name for name in os.listdir(path) if name.startswith('tty')),
+            path, interval=0.02, settle=0.01, use_inotify=use_inotify)
+        watcher.on_changed = port_watcher_on_changed
+        watcher.start()
+        time.sleep(0.1)
+        open(os.path.join(path, 'ttyUSB0'), 'w').close()
+        open(os.path.join(path, 'null'), 'w').close()
+        time.sleep(0.1)
+        os.remove(os.path.join(path, 'ttyS0'))
+        time.sleep(0.1)
+        watcher.stop()
+
+def port_watcher_on_changed(added, removed):
+    print('watcher:on_changed(added={}, removed={})'.format(added, removed))
+
+def rs232port_loopback():
+    import loopback
+    result = loopback.run(rate=2000, duration=0.5, idle=0.2)
+    print('loopback:run()->: received {received_lines}/{sent_lines}, lost {lost_lines}, '
+          'out of order {out_of_order}'.format(**result))
+
+def stream_reader_unplug():
+    import pty, rs232port
+    master, slave = pty.openpty()
+    port = rs232port.RS232Port()
+    port.open(os.ttyname(slave), 115200)
+    reader = stream.StreamReader(bulk=True)
+    reader.connect('read_error', stream_reader_read_error)
+    reader.start(port.get_stream())
+    os.close(master)
+    reader.join(2)
+    port.close()
+    os.close(slave)
+
+def stream_reader_read_error(err, *args, **kwargs):
+    print('reader:read_error(err={})'.format(err))
+
+def port_multiplexer_close():
+    import pty, time, rs232port
+    ptys = [pty.openpty() for _ in range(2)]
+    ports = []
+    multiplexer = stream.PortMultiplexer(timeout=0.02)
+    for master, slave in ptys:
+        port = rs232port.RS232Port()
+        port.open(os.ttyname(slave), 115200)
+        ports.append(port)
+        reader = multiplexer.add(port.get_stream(), stream.StreamReader(framed=True))
+        reader.connect('read_message', stream_reader_read_message)
+    multiplexer.start()
+    os.write(ptys[1][0], b'last line without end')
+    # the closed port is dropped, the other one is flushed at stop()
+    ports[0].close()
+    time.sleep(0.1)
+    print('multiplexer:close()->: streams left', multiplexer.count)
+    multiplexer.stop()
+    multiplexer.join()
+    ports[1].close()
+    for master, slave in ptys:
+        os.close(master)
+        os.close(slave)
+
+def async_port():
+    import asyncio, pty, tty, aioport
+
+    async def run():
+        master, slave = pty.openpty()
+        tty.setraw(master)
+        port = await aioport.AsyncRS232Port.open(os.ttyname(slave), 115200)
+        os.write(master, b'x,y\n1,2\n3,')
+        os.write(master, b'4\n')
+        async for rows in port.rows():
+            stream_parser_read_floats(rows)
+            if len(rows) > 1 or rows[0][0] == 3.0:
+                break
+        await port.write('ping\n')
+        await port.drain()
+        print('aioport:write()->:', os.read(master, 100))
+
+        # data the port cannot take any more: drain() is failed by close()
+        drain = asyncio.ensure_future(port.write(b'x' * (1 << 20)))
+        await asyncio.sleep(0.05)
+        port.close()
+        await asyncio.wait([drain], timeout=1)
+        print('aioport:close()->: drain', repr(drain.exception()))
+        os.close(master)
+        os.close(slave)
+
+        # the other end is gone: write() raises the write error
+        master, slave = pty.openpty()
+        port = await aioport.AsyncRS232Port.open(os.ttyname(slave), 115200)
+        os.close(master)
+        try:
+            await port.write('ping\n')
+            await port.drain()
+        except OSError as err:
+            print('aioport:write()->: error', err.errno)
+        port.close()
+        os.close(slave)
+
+    asyncio.run(run())
+
 def stream_reader_read_message(msg, *args, **kwargs):
     print('reader:read_message(msg={})'.format(msg))
 
 if __name__ == '__main__':
     stream_parser()
+    stream_parser_chunk()
+    stream_parser_named()
+    sparse_channels()
+    fixed_y_range()
+    find_peaks()
     stream_reader()
+    stream_reader_bulk()
+    line_framer()
+    sample_queue()
+    signal_dispatcher()
+    session_replay()
+    session_recorder_errors()
+    generator_port()
+    port_multiplexer()
+    headless_monitor()
+    port_watcher()
+    if os.name == 'posix':
+        rs232port_loopback()
+        stream_reader_unplug()
+        port_multiplexer_close()
+        async_port()
 
 
 
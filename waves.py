@@ -0,0 +1,443 @@
+import math, numpy, cairo
+import decimation
+from collections import deque, namedtuple
+
+
+def _read_only(array):
+    array.flags.writeable = False
+    return array
+
+
+_EMPTY = _read_only(numpy.empty((0, 2)))
+
+
+class WaveFactory:
+
+    buffer_size = 0
+    # reduce every wave to ~2 points per pixel column: 'min_max', 'lttb' or None
+    decimation = 'min_max'
+    # fixed (bottom, top) of the Y axis, autoscale when None
+    y_range = None
+    # keep the autoscaled Y axis until the range shrinks by this fraction
+    y_hysteresis = 0.0
+    _y_scale = None
+    _color_counter = 0
+    _label_counter = 0
+
+    colors = [
+        (102, 168, 203),  # dirty blue
+        (224, 56, 44),  # scarlet
+        (41, 155, 73),  # dark mint
+    ]
+
+    def __init__(self):
+        tmp_colors = []
+        for color in self.colors:
+            r, g, b = color
+            tmp_colors.append((r / 255 , g / 255, b / 255))
+        self.colors = tmp_colors
+        self._waves = []
+        self._labels = []
+        # what is drawn: tuple of WaveFrame, replaced as a whole by
+        # prepare_drawing_data(), so readers on other threads never see a
+        # half updated frame
+        self.frame = ()
+
+    def reset(self):
+        self._waves = []
+        self._labels = []
+        self._color_counter = 0
+        self._label_counter = 0
+        self._y_scale = None
+        self.frame = ()
+
+    def get_next_color(self):
+        color = self.colors[self._color_counter]
+        self._color_counter += 1
+        if self._color_counter == len(self.colors):
+            self._color_counter = 0
+        return color
+
+    def get_next_label(self):
+        if self._labels and self._label_counter < len(self._labels):
+            title = self._labels[self._label_counter]
+            self._label_counter += 1
+            return title
+        return None
+
+    def create_wave(self):
+        wave = Wave(self.buffer_size, self.get_next_color(), self.get_next_label())
+        self._waves.append(wave)
+        return wave
+
+    def put_rows(self, values):
+        # one column of the 2-D block per wave; NaN marks a value the line did
+        # not carry (named values, short rows) and keeps its slot, so every
+        # wave has one sample per line and the waves stay aligned in time
+        for i in range(values.shape[1] - len(self._waves)):
+            self.create_wave()
+        for i in range(values.shape[1]):
+            self._waves[i].put_many(values[:, i])
+
+    def create_label(self, title):
+        self._labels.append(title)
+
+    def get_count_labels(self):
+        return len(self._labels)
+
+    def get_wave(self, index):
+        return self._waves[index]
+
+    def get_waves(self):
+        return self._waves
+
+    def get_count_waves(self):
+        return len(self._waves)
+
+    def calculate_drawing_data(self):
+        for wave in self._waves:
+            wave.set_buff_with_data(wave.get_buff())
+        if self.y_range is not None:
+            bottom, top = self.y_range
+            return top - bottom, bottom
+
+        _max_y, _min_y = ([], [])
+        for wave in self._waves:
+            max_y = wave.get_max()
+            min_y = wave.get_min()
+            if max_y is None:
+                continue
+
+            if min_y < 0:
+                max_y += -min_y
+
+            space = max_y / 10  # top and bottom space percent
+            _max_y.append(max_y + space)
+            _min_y.append(min_y - (space / 2))
+
+        if _max_y and _min_y:
+            return self._apply_y_hysteresis(max(_max_y), min(_min_y))
+        return 0, 0
+
+    def _apply_y_hysteresis(self, max_y, min_y):
+        if not self.y_hysteresis or self._y_scale is None:
+            self._y_scale = (max_y, min_y)
+            return self._y_scale
+        # rescale when the data leaves the axis or the range shrinks enough
+        current_max_y, current_min_y = self._y_scale
+        if min_y < current_min_y \
+                or min_y + max_y > current_min_y + current_max_y \
+                or max_y < current_max_y * (1 - self.y_hysteresis):
+            self._y_scale = (max_y, min_y)
+        return self._y_scale
+
+    def prepare_drawing_data(self, width=0):
+        max_y, min_y = self.calculate_drawing_data()
+        for wave in self._waves:
+            if max_y == 0:
+                continue
+            wave.prepare_drawing_data(max_y, min_y, width, self.decimation)
+        # publish: one assignment
+        self.frame = tuple(wave.get_frame() for wave in self._waves)
+
+    def draw(self, ctx):
+        frame = self.frame
+        draw_waves(ctx, frame)
+        draw_legend(ctx, frame)
+
+
+# drawing of a published frame (tuple of WaveFrame)
+def draw_waves(ctx, frame):
+    for wave in frame:
+        wave.draw(ctx)
+
+
+def draw_legend(ctx, frame):
+    ctx.select_font_face("Arial", cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_NORMAL)
+    ctx.set_font_size(0.025)
+    label_y_offset = 0
+    for wave in frame:
+        wave.draw_label(ctx, label_y_offset)
+        label_y_offset += 1
+
+
+def get_legend(frame):
+    # what the legend shows, it is drawn again only when this changes
+    return tuple((wave.label, wave.color) for wave in frame)
+
+
+class FrameRenderer:
+    # draws frames into image surfaces, away from the GTK thread: the grid
+    # and the legend are cached in a background surface that is rebuilt only
+    # when the size or the legend changes, a frame is the background plus
+    # the waves
+    def __init__(self):
+        self._background = None
+        self._background_key = None
+
+    def render(self, frame, width, height):
+        key = (width, height, get_legend(frame))
+        if key != self._background_key:
+            self._background = self._render_background(frame, width, height)
+            self._background_key = key
+
+        # a new surface for every frame: the last one may still be painted
+        surface = cairo.ImageSurface(cairo.FORMAT_RGB24, width, height)
+        ctx = cairo.Context(surface)
+        ctx.set_source_surface(self._background, 0, 0)
+        ctx.paint()
+        ctx.scale(width, height)
+        draw_waves(ctx, frame)
+        surface.flush()
+        return surface
+
+    def _render_background(self, frame, width, height):
+        background = cairo.ImageSurface(cairo.FORMAT_RGB24, width, height)
+        ctx = cairo.Context(background)
+        ctx.set_source_rgb(1, 1, 1)
+        ctx.paint()
+        ctx.scale(width, height)
+        self.draw_grid(ctx)
+        draw_legend(ctx, frame)
+        background.flush()
+        return background
+
+    @staticmethod
+    def draw_grid(ctx):
+        ctx.set_source_rgb(0, 0, 0)
+        ctx.set_line_width(.001)
+        ctx.set_dash([.002])
+        for i in (n * .04 for n in range(25)):
+            ctx.move_to(i, 1)
+            ctx.line_to(i, 0)
+            ctx.move_to(0, 1-i)
+            ctx.line_to(1, 1-i)
+
+        ctx.stroke()
+        ctx.set_dash([])
+
+
+class WaveFrame(namedtuple('WaveFrame', 'color label coordinates peaks_positive peaks_negative')):
+    # drawing data of one wave, the arrays are read-only
+    __slots__ = ()
+
+    def draw(self, ctx):
+        if not len(self.coordinates):
+            return
+
+        ctx.set_source_rgb(*self.color)
+        ctx.set_line_width(.002)
+        ctx.set_dash([])
+
+        # missing values (NaN) are skipped: a channel sent on some lines only
+        # is drawn from one of its values to the next
+        move = True
+        for x, y in self.coordinates:
+            if y != y:
+                continue
+            if move:
+                ctx.move_to(x, 1-y)
+                move = False
+            else:
+                ctx.line_to(x, 1-y)
+        ctx.stroke()
+
+        # вывод кружков на положительной вершине синусоиды
+        for x, y in self.peaks_positive:
+            ctx.arc(x, 1-y, 0.005,  0, 2*math.pi)
+            ctx.fill()
+            ctx.stroke()
+
+        # вывод кружков на отрицательной вершине синусоиды
+        for x, y in self.peaks_negative:
+            ctx.arc(x, 1 - y, 0.005, 0, 2 * math.pi)
+            ctx.fill()
+            ctx.stroke()
+
+    def draw_label(self, ctx, y_offset):
+        if self.label is None:
+            return
+        y_offset_rec = 0.01
+        y_offset_text = 0.03
+        for i in range(y_offset):
+            y_offset_rec += 0.03
+            y_offset_text += 0.03
+
+        ctx.rectangle(0.01, y_offset_rec, 0.02, 0.02)
+        ctx.set_source_rgb(*self.color)
+        ctx.fill()
+        ctx.stroke()
+
+        # the font is selected once for the legend, draw_legend()
+        ctx.set_source_rgb(0,0,0)
+        ctx.move_to(0.04, y_offset_text)
+        ctx.show_text(self.label)
+
+        ctx.stroke()
+
+
+class Wave:
+    def __init__(self, size, color, label):
+        self._size = size
+        # every sample is stored twice (at i and i + size), so the ordered
+        # window of the ring is always a contiguous slice of the array
+        self._buff = numpy.full(size * 2, numpy.nan)
+        self._buff_with_data = self._buff[:0]
+        self._index = 0
+        self._count = 0
+        # monotonic queues of (sequence number, value) for the window extrema
+        self._seq = 0
+        self._max_queue = deque()
+        self._min_queue = deque()
+        self._color = color
+        if label is not None:
+            self._label = label.strip()
+        else:
+            self._label = None
+
+        self.coordinates = _EMPTY
+        self.y_peaks_positive_coordinates = _EMPTY  # координаты положительных вершины синусоиды
+        self.y_peaks_negative_coordinates = _EMPTY  # координаты отрицательных вершины синусоиды
+
+    def put(self, value):
+        self._buff[self._index] = value
+        self._buff[self._index + self._size] = value
+        self._index += 1
+        if self._index == self._size:
+            self._index = 0
+        if self._count < self._size:
+            self._count += 1
+
+        if value == value:  # not NaN
+            while self._max_queue and self._max_queue[-1][1] <= value:
+                self._max_queue.pop()
+            self._max_queue.append((self._seq, value))
+            while self._min_queue and self._min_queue[-1][1] >= value:
+                self._min_queue.pop()
+            self._min_queue.append((self._seq, value))
+        self._seq += 1
+        self._expire_extrema()
+
+    def put_many(self, values):
+        values = numpy.asarray(values, dtype=numpy.float64).ravel()
+        if values.size > self._size:
+            self._seq += values.size - self._size
+            values = values[-self._size:]
+        count = values.size
+        if not count:
+            return
+        first = min(count, self._size - self._index)
+        self._write(self._index, values[:first])
+        self._write(0, values[first:])
+        self._index = (self._index + count) % self._size
+        self._count = min(self._count + count, self._size)
+
+        seqs = numpy.arange(self._seq, self._seq + count)
+        finite = ~numpy.isnan(values)
+        if not finite.all():
+            values, seqs = values[finite], seqs[finite]
+        if values.size:
+            self._extend_extremum(self._max_queue, seqs, values, numpy.maximum, numpy.greater)
+            self._extend_extremum(self._min_queue, seqs, values, numpy.minimum, numpy.less)
+        self._seq += count
+        self._expire_extrema()
+
+    @staticmethod
+    def _extend_extremum(queue, seqs, values, accumulate, better):
+        # only samples that beat every later sample of the block survive in
+        # a monotonic queue, so they are found without a per-sample loop
+        suffix = accumulate.accumulate(values[::-1])[::-1]
+        keep = numpy.ones(values.size, dtype=bool)
+        better(values[:-1], suffix[1:], out=keep[:-1])
+        while queue and not better(queue[-1][1], suffix[0]):
+            queue.pop()
+        queue.extend(zip(seqs[keep].tolist(), values[keep].tolist()))
+
+    def _expire_extrema(self):
+        oldest = self._seq - self._count
+        while self._max_queue and self._max_queue[0][0] < oldest:
+            self._max_queue.popleft()
+        while self._min_queue and self._min_queue[0][0] < oldest:
+            self._min_queue.popleft()
+
+    def get_max(self):
+        return self._max_queue[0][1] if self._max_queue else None
+
+    def get_min(self):
+        return self._min_queue[0][1] if self._min_queue else None
+
+    def _write(self, start, values):
+        end = start + values.size
+        self._buff[start:end] = values
+        self._buff[start + self._size:end + self._size] = values
+
+    def get_buff(self):
+        # ordered view (oldest sample first) without copying
+        end = self._index + self._size
+        return self._buff[end - self._count:end]
+
+    def set_buff_with_data(self, buff):
+        self._buff_with_data = buff
+
+    def get_color(self):
+        return self._color
+
+    def get_label(self):
+        return self._label
+
+    def prepare_drawing_data(self, max_y, min_y, columns=0, method=None):
+        buff = self._buff_with_data
+        if not buff.size:
+            return
+        # вершина синусоиды
+        y_peaks_positive, y_peaks_negative = self._find_peaks(buff)
+
+        x = numpy.arange(1, buff.size + 1) / self._size
+        # at most ~2 points per pixel column are stroked; a partly filled
+        # buffer covers only a part of the plot width
+        columns = max(1, columns * buff.size // self._size) if columns > 0 else 0
+        indexes = None
+        if columns > 0 and method == 'min_max':
+            indexes = decimation.min_max(buff, columns)
+        elif columns > 0 and method == 'lttb':
+            indexes = decimation.lttb(x, buff, 2 * columns)
+        if indexes is not None and len(indexes) < buff.size:
+            y_peaks_positive = self._one_per_column(y_peaks_positive, buff.size, columns)
+            y_peaks_negative = self._one_per_column(y_peaks_negative, buff.size, columns)
+        else:
+            indexes = slice(None)
+
+        coordinates = numpy.empty((buff.size, 2))
+        coordinates[:, 0] = x
+        numpy.subtract(buff, min_y, out=coordinates[:, 1])
+        coordinates[:, 1] /= max_y
+
+        # the x of a missing value (NaN) is kept free, its point is not stroked
+        coordinates_drawn = coordinates[indexes]
+        finite = ~numpy.isnan(coordinates_drawn[:, 1])
+        if not finite.all():
+            coordinates_drawn = coordinates_drawn[finite]
+        self.coordinates = _read_only(coordinates_drawn)
+        self.y_peaks_positive_coordinates = _read_only(coordinates[y_peaks_positive])  # координаты положительных вершины синусоиды
+        self.y_peaks_negative_coordinates = _read_only(coordinates[y_peaks_negative])  # координаты отрицательных вершины синусоиды
+
+    def get_frame(self):
+        return WaveFrame(self._color, self._label, self.coordinates,
+                         self.y_peaks_positive_coordinates, self.y_peaks_negative_coordinates)
+
+    @staticmethod
+    def _one_per_column(indexes, count, columns):
+        # several peaks in the same pixel column are drawn as one circle
+        _, first = numpy.unique(indexes * columns // count, return_index=True)
+        return indexes[first]
+
+    @staticmethod
+    def _find_peaks(buff):
+        # indexes of local maxima and minima; the first two samples and the
+        # last one are never peaks, as in the loop this replaced (i - 1 > 0)
+        y = buff[2:-1]
+        left = buff[1:-2]
+        right = buff[3:]
+        positive = numpy.flatnonzero((y > left) & (y > right)) + 2
+        negative = numpy.flatnonzero((y < left) & (y < right)) + 2
+        return positive, negative
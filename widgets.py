@@ -1,53 +1,154 @@
-import gi, time, logging, math, numpy, cairo
-from threading import Thread, Lock
-from datetime import datetime
+import gi, time, itertools, traceback
+import stream, portwatch
+from threading import Thread, Event
+from collections import deque
 
 gi.require_version("Gtk", "3.0")
-from gi.repository import Gtk, GObject
+gi.require_version("PangoCairo", "1.0")
+from gi.repository import Gtk, Gdk, GLib, PangoCairo
 
-logging.basicConfig(level=logging.DEBUG)
 
-
-class DisplayWidget(Gtk.ScrolledWindow):
-    def __init__(self):
-        super(DisplayWidget, self).__init__()
+class DisplayWidget(Gtk.Box):
+    def __init__(self, scrollback=10000):
+        super(DisplayWidget, self).__init__(orientation=Gtk.Orientation.HORIZONTAL)
         self.set_hexpand(True)
         self.set_vexpand(True)
 
-        self._view = Gtk.TextView()
-        self._view.set_editable(False)
-        self.add(self._view)
+        # the last `scrollback` complete lines as ready markup
+        self._lines = deque(maxlen=scrollback)
+        # markup of the line that is being received
+        self._line = ''
+        self._redraw_scheduled = False
+        # stay at the last line while the view is scrolled to the bottom
+        self._follow = True
 
-        self._buff = self._view.get_buffer()
+        self._timestamp_second = None
+        self._timestamp = ''
 
-    @staticmethod
-    def _get_start_line_info():
-        return r'<span foreground="blue">[{time}]</span>' \
-            .format(time=datetime.now().strftime("%H:%M:%S"))
+        self._area = Gtk.DrawingArea()
+        self._area.set_hexpand(True)
+        self._area.set_vexpand(True)
+        self._area.add_events(Gdk.EventMask.SCROLL_MASK)
+        self._area.connect("draw", self._on_draw)
+        self._area.connect("scroll-event", self._on_scroll)
+        self._area.connect("size-allocate", self._on_size_allocate)
+
+        self._layout = self._area.create_pango_layout('X')
+        self._row_height = max(self._layout.get_pixel_size()[1], 1)
+
+        self._adjustment = Gtk.Adjustment(value=0, lower=0, upper=0, step_increment=1,
+                                          page_increment=10, page_size=1)
+        self._adjustment.connect("value-changed", self._on_scroll_changed)
+        scrollbar = Gtk.Scrollbar(orientation=Gtk.Orientation.VERTICAL, adjustment=self._adjustment)
+
+        self.pack_start(self._area, True, True, 0)
+        self.pack_start(scrollbar, False, False, 0)
+
+    def _get_start_line_info(self):
+        # the markup is built once per second, not once per line
+        now = int(time.time())
+        if now != self._timestamp_second:
+            self._timestamp_second = now
+            self._timestamp = r'<span foreground="blue">[{time}]</span>' \
+                .format(time=time.strftime("%H:%M:%S", time.localtime(now)))
+        return self._timestamp
 
     @staticmethod
     def _get_end_line_info(full_msg):
         return r'<span foreground="red">[{msg_size}]</span>' \
             .format(msg_size=len(full_msg.encode('utf-8')))
 
+    # the out_*() handlers run in the main loop: connect them with
+    # is_gobject=True, the dispatcher hands them over in batches
     def out_start_line(self, msg, *args, **kwargs):
-        self.out_part_line(DisplayWidget._get_start_line_info() + msg)
+        self._append([(self._get_start_line_info() + GLib.markup_escape_text(msg), False)])
 
     def out_part_line(self, msg, *args, **kwargs):
-        self._buff.insert_markup(self._buff.get_end_iter(), msg, -1)
-        self._view.scroll_to_mark(self._buff.get_insert(), 0.0, True, 0.0, 1.0)
+        self._append([(GLib.markup_escape_text(msg), False)])
 
     def out_end_line(self, msg, full_msg, *args, **kwargs):
         end_line_info = self._get_end_line_info(full_msg)
-        self.out_part_line(msg + end_line_info + '\n')
+        self._append([(GLib.markup_escape_text(msg) + end_line_info, True)])
 
     def out_full_line(self, msg):
-        start_line_info = DisplayWidget._get_start_line_info()
-        end_line_info = DisplayWidget._get_end_line_info(msg)
-        self.out_part_line(start_line_info + msg + end_line_info + '\n')
+        self.out_lines([msg])
+
+    def out_lines(self, lines, *args, **kwargs):
+        start_line_info = self._get_start_line_info()
+        self._append([(start_line_info + GLib.markup_escape_text(msg) + self._get_end_line_info(msg), True)
+                      for msg in lines])
 
     def clear(self):
-        self._buff.set_text("")
+        self._lines.clear()
+        self._line = ''
+        self._update_adjustment()
+        self._area.queue_draw()
+
+    def _append(self, fragments):
+        for markup, end_of_line in fragments:
+            parts = markup.split('\n')
+            for part in parts[:-1]:
+                self._lines.append(self._line + part)
+                self._line = ''
+            self._line += parts[-1]
+            if end_of_line:
+                self._lines.append(self._line)
+                self._line = ''
+
+        # one redraw after the whole batch of the dispatcher
+        if not self._redraw_scheduled:
+            self._redraw_scheduled = True
+            GLib.idle_add(self._redraw)
+
+    def _redraw(self):
+        self._redraw_scheduled = False
+        self._update_adjustment()
+        self._area.queue_draw()
+        return False
+
+    def _count_rows(self):
+        return len(self._lines) + (1 if self._line else 0)
+
+    def _update_adjustment(self):
+        page_size = max(self._area.get_allocated_height() // self._row_height, 1)
+        upper = max(self._count_rows(), page_size)
+        value = upper - page_size if self._follow else min(self._adjustment.get_value(), upper - page_size)
+        self._adjustment.configure(value, 0, upper, 1, page_size, page_size)
+
+    def _on_size_allocate(self, area, allocation):
+        self._update_adjustment()
+
+    def _on_scroll_changed(self, adjustment):
+        self._follow = adjustment.get_value() >= adjustment.get_upper() - adjustment.get_page_size()
+        self._area.queue_draw()
+
+    def _on_scroll(self, area, event):
+        if event.direction == Gdk.ScrollDirection.UP:
+            step = -3
+        elif event.direction == Gdk.ScrollDirection.DOWN:
+            step = 3
+        else:
+            return False
+        self._adjustment.set_value(self._adjustment.get_value() + step)
+        return True
+
+    def _on_draw(self, area, ctx):
+        ctx.set_source_rgb(1, 1, 1)
+        ctx.paint()
+        ctx.set_source_rgb(0, 0, 0)
+
+        # only the rows in the window are laid out
+        first = int(self._adjustment.get_value())
+        count = area.get_allocated_height() // self._row_height + 1
+        rows = list(itertools.islice(self._lines, first, first + count))
+        if self._line and len(rows) < count:
+            rows.append(self._line)
+
+        for i, markup in enumerate(rows):
+            self._layout.set_markup(markup, -1)
+            ctx.move_to(2, i * self._row_height)
+            PangoCairo.show_layout(ctx, self._layout)
+        return False
 
 
 class ConnectionWidget(Gtk.Grid):
@@ -62,6 +163,7 @@ class ConnectionWidget(Gtk.Grid):
         self._device = device
         self._is_connected = False
         self._available_ports = []
+        self._port_watcher = None
 
         self._bt_connect = Gtk.Button()
         self._bt_connect.connect("clicked", self._do_connect)
@@ -78,7 +180,7 @@ class ConnectionWidget(Gtk.Grid):
         self._baudrate.set_entry_text_column(False)
         self._baudrate.set_size_request(100, 0)
 
-        for i in [110, 300, 1200, 2400, 4800, 9600, 19200, 38400, 57600,  115200]:
+        for i in [110, 300, 1200, 2400, 4800, 9600, 19200, 38400, 57600, 115200, 230400, 460800, 921600]:
             self._baudrate.append_text(str(i))
         self._baudrate.set_active(5)  # 9600
 
@@ -107,7 +209,8 @@ class ConnectionWidget(Gtk.Grid):
         self.attach(box1, 0, 0, 1, 1)
         self.attach(box2, 0, 1, 1, 1)
         self._update_widgets()
-        self._update_ports()
+        # the port watcher starts when the window is on screen
+        self._map_handler = self.connect("map", self._on_map)
 
     class ReadStream(object):
         def __init__(self, stream, on_read_error_signal):
@@ -116,13 +219,41 @@ class ConnectionWidget(Gtk.Grid):
 
         def readline(self):
             if self._stream is None:
-                return ''
+                return None
             try:
                 return self._stream.readline()
             except Exception as err:
-                self._stream = None
-                if self._on_read_error is not None:
-                    self._on_read_error(err)
+                self._signal_read_error(err)
+
+        def read(self, size=1):
+            if self._stream is None:
+                return None
+            try:
+                return self._stream.read(size)
+            except Exception as err:
+                self._signal_read_error(err)
+
+        @property
+        def in_waiting(self):
+            if self._stream is None:
+                return 0
+            try:
+                return self._stream.in_waiting
+            except Exception as err:
+                self._signal_read_error(err)
+                return 0
+
+        def fileno(self):
+            return self._stream.fileno()
+
+        @property
+        def timeout(self):
+            return getattr(self._stream, 'timeout', None)
+
+        def _signal_read_error(self, err):
+            self._stream = None
+            if self._on_read_error is not None:
+                self._on_read_error(err)
 
     def _signal_error(self, err):
         if self.on_error is not None:
@@ -146,7 +277,6 @@ class ConnectionWidget(Gtk.Grid):
             if self.on_disconnected is not None:
                 self.on_disconnected()
         self._update_widgets()
-        self._update_ports()
 
     def _on_click_send(self, widget):
         try:
@@ -185,95 +315,150 @@ class ConnectionWidget(Gtk.Grid):
         self._lb_status.set_markup(status)
         self._bt_connect.set_label(bt_label)
 
-    def _update_ports(self):
-        if not self._is_connected:
-            Thread(target=self._get_ports, daemon=True).start()
+    def _on_map(self, widget):
+        self.disconnect(self._map_handler)
+        GLib.idle_add(self._start_port_watcher, priority=GLib.PRIORITY_LOW)
 
-    def _get_ports(self):
-        while True:
-            if self._is_connected:
-                break
-            GObject.idle_add(self._append_ports, self._device.get_ports(), property=GObject.PRIORITY_DEFAULT)
-            time.sleep(0.5)
+    def _start_port_watcher(self):
+        self._port_watcher = portwatch.PortWatcher(self._device.get_ports)
+        self._port_watcher.on_changed = self._on_ports_changed
+        self._port_watcher.start()
+        self.connect("destroy", self._stop_port_watcher)
+        return False
+
+    def _stop_port_watcher(self, widget):
+        self._port_watcher.stop()
 
-    def _append_ports(self, ports):
-        for port in set(ports).difference(set(self._available_ports)):
+    # called by the watcher thread
+    def _on_ports_changed(self, added, removed):
+        GLib.idle_add(self._apply_ports, added, removed)
+
+    def _apply_ports(self, added, removed):
+        for port in removed:
+            index = self._available_ports.index(port)
+            del self._available_ports[index]
+            self._port.remove(index)
+        for port in added:
             self._available_ports.append(port)
             self._port.append_text(port)
-        if len(self._available_ports) == 1:
+        if self._port.get_active() < 0 and self._available_ports:
             self._port.set_active(0)
+        return False
 
 
 class PlotterWidget(Gtk.Box):
 
-    def __init__(self):
+    def __init__(self, fps=30, buffer_size=200, y_range=None, y_hysteresis=0.0):
         super(PlotterWidget, self).__init__(orientation=Gtk.Orientation.VERTICAL)
         self._frame = Gtk.Frame()
         # self._frame.set_size_request(700, 0)
         self._frame.set_size_request(700, 700)
         self._frame.vexpand = True
         self._frame.hexpand = True
-        self._surface = None
 
         self._area = Gtk.DrawingArea()
         self._area.connect("draw", self.on_draw)
         self._area.connect("configure-event", self.on_configure)
         self._frame.add(self._area)
+        self._width = 0
+        self._height = 0
+        # last frame rendered by the update thread, on_draw only paints it
+        self._frame_surface = None
+
+        # frame clock scheduler: new data or a resize mark the plot dirty, the
+        # tick callback wakes the update thread at most fps times per second
+        # and only when it is idle (frames are skipped under load), the tick
+        # callback is removed while there is nothing to do
+        self.fps = fps
+        self._dirty = False
+        self._rendering = False
+        self._frame_ready = False
+        self._last_request = 0.0
+        self._tick_id = None
+        self._wake = Event()
 
         # test buttons
         box = Gtk.HBox()
         btn_reset = Gtk.Button(label="Reset")
         btn_reset.connect("clicked", self.on_click_btn_reset)
 
-        btn_sin_wave = Gtk.Button(label="sin wave")
-        btn_sin_wave.connect("clicked", self.on_click_btn_sin_wave)
-
         box.pack_start(btn_reset, False, True, 2)
-        box.pack_start(btn_sin_wave, False, True, 2)
 
         self.pack_start(box, False, True, 2)
         self.pack_start(self._frame, True, True, 2)
 
-        # max point by x
-        self.wave_factory = WaveFactory()
+        # created by the update thread, waves loads numpy and cairo
+        self.wave_factory = None
         # count points by x
-        self.wave_factory.buffer_size = 200
+        self.buffer_size = buffer_size
+        # fixed (bottom, top) of the Y axis or None to autoscale, see WaveFactory
+        self.y_range = y_range
+        self.y_hysteresis = y_hysteresis
         self._wave_labels_created = False
+        self._channel_labels = []
+        # the reset is done by the update thread, the only user of the waves
+        self._reset_requested = False
+
+        # rows from the parser thread, applied by the update thread
+        self.received_floats = stream.SampleQueue(maxlen=100000)
+        # lines for the header of the waves
+        self.received_msg = stream.SampleQueue(maxlen=1000)
 
 ########################################################################################################################
-    received_floats = []
     def on_read_float(self, values):
-        self.received_floats.append(values)
+        self.received_floats.put(values)
+        self.mark_dirty()
         # count_waves = len(values)
         # for i in range(count_waves - self.wave_factory.get_count_waves()):
         #     self.wave_factory.create_wave()
         # for i in range(count_waves):
         #     self.wave_factory.get_wave(i).put(values[i])
 
-    received_msg = []
+    def on_read_floats(self, values):
+        # batch of rows from StreamParser.parse_chunk()
+        self.received_floats.put_many(values)
+        self.mark_dirty()
+
+    def on_read_lines(self, lines):
+        if not self._wave_labels_created:
+            self.received_msg.put_many(lines)
+            self.mark_dirty()
+
+    def on_read_channels(self, names):
+        # named values ("label:value") label the waves instead of a header line
+        self._channel_labels = names
+        self.mark_dirty()
+
     def on_read_last_part(self, msg, full_msg, *args, **kwargs):
-        self.received_msg.append(full_msg)
+        self.received_msg.put(full_msg)
+        self.mark_dirty()
         # self.create_labels(full_msg)
 
     def on_read_all(self, full_msg, *args, **kwargs):
-        self.received_msg.append(full_msg)
+        self.received_msg.put(full_msg)
+        self.mark_dirty()
         # self.create_labels(full_msg)
 
     def update_waves(self):
-        if not self.received_floats:
+        # all rows received since the last update go in as one block
+        rows = self.received_floats.drain()
+        if not rows:
             return
-        values = self.received_floats.pop(0)
-        count_waves = len(values)
-        for i in range(count_waves - self.wave_factory.get_count_waves()):
-            self.wave_factory.create_wave()
-        for i in range(count_waves):
-            self.wave_factory.get_wave(i).put(values[i])
+        self.wave_factory.put_rows(stream.rows_to_array(rows))
 
     # def create_labels(self, msg):
     def update_labels(self):
-        if self._wave_labels_created or not self.received_msg:
+        channel_labels = self._channel_labels
+        if channel_labels:
+            for lb in channel_labels[self.wave_factory.get_count_labels():]:
+                self.wave_factory.create_label(lb)
+            self._wave_labels_created = True
+            return
+
+        messages = self.received_msg.drain()
+        if self._wave_labels_created or not messages:
             return
-        msg = self.received_msg.pop(0)
+        msg = messages[0]
         split_by = None
         if ',' in msg:
             split_by = ','
@@ -287,308 +472,88 @@ class PlotterWidget(Gtk.Box):
 ########################################################################################################################
 
     def on_click_btn_reset(self, widget):
-        self.test_stop_loop = True
-        # time.sleep(5.0)
-        self.wave_factory.reset()
-        self._wave_labels_created = False
-
-    def on_click_btn_sin_wave(self, widget):
-        self.test_stop_loop = False
-        Thread(target=self._loop_sinus_wave, daemon=True).start()
-
-    test_device = None
-    test_stop_loop = False
-    def _loop_sinus_wave(self):
-        # labels
-        self.test_device.write('sinus1, sinus2(+90dg) \n')
-        angle = 0.0
-        while True:
-            if self.test_stop_loop:
-                break
-            val1 = round(math.sin(angle), 5)
-            val2 = round(5 * math.sin(angle + 90.0), 5)
-            # val3 = round(3 * math.sin(angle + 30.0), 5)
-            #
-            # val4 = round(2 * math.sin(angle), 5)
-            # val5 = round(6 * math.sin(angle + 120.0), 5)
-            # val6 = round(8 * math.sin(angle + 15.0), 5)
-
-            # send value as print()
-            self.test_device.write(str(val1))
-            self.test_device.write(',')
-            self.test_device.write(str(val2))
-            # self.test_device.write(',')
-            # self.test_device.write(str(val3))
-            # self.test_device.write(',')
-            # self.test_device.write(str(val4))
-            # self.test_device.write(',')
-            # self.test_device.write(str(val5))
-            # self.test_device.write(',')
-            # self.test_device.write(str(val6))
-
-            # send println()
-            self.test_device.write('\n')
-
-            angle += .1
-            # signal spped
-            time.sleep(0.02)
-
-    def draw_grid(self, ctx):
-        ctx.set_source_rgb(0, 0, 0)
-        ctx.set_line_width(.001)
-        ctx.set_dash([.002])
-        for i in numpy.arange(0, 1, .04):
-            ctx.move_to(i, 1)
-            ctx.line_to(i, 0)
-            ctx.move_to(0, 1-i)
-            ctx.line_to(1, 1-i)
-
-        ctx.stroke()
+        self._reset_requested = True
+        self.mark_dirty()
 
     def on_draw(self, area, ctx):
-        ctx.set_source_rgb(255, 255, 255)
+        frame = self._frame_surface
+        if frame is None:
+            ctx.set_source_rgb(1, 1, 1)
+        else:
+            ctx.set_source_surface(frame, 0, 0)
         ctx.paint()
-        ctx.scale(self._surface.get_width(), self._surface.get_height())
-        self.draw_grid(ctx)
-        self.wave_factory.draw(ctx)
         return False
 
     def on_configure(self, area, event, data=None):
-        if self._surface is not None:
-            self._surface.finish()
-            self.surface = None
-        self._surface = cairo.ImageSurface(cairo.FORMAT_ARGB32,
-                                                   self._area.get_allocated_width(),
-                                                   self._area.get_allocated_height())
+        self._width = self._area.get_allocated_width()
+        self._height = self._area.get_allocated_height()
+        self.mark_dirty()
         return False
 
     # refresh drawing area
     def start_drawing(self):
-        Thread(target=self._start_drawing, daemon=True).start()
         Thread(target=self._full_update, daemon=True).start()
+        self.mark_dirty()
+
+    # any thread: the plot has to be updated
+    def mark_dirty(self):
+        # the flag is set before the callback is checked, _on_tick clears
+        # the callback before it checks the flag: no update is lost
+        self._dirty = True
+        if self._tick_id is None:
+            GLib.idle_add(self._start_ticks)
+
+    def _start_ticks(self):
+        if self._tick_id is None:
+            self._tick_id = self._area.add_tick_callback(self._on_tick)
+        return False
 
-    def _full_update(self):
-        while True:
-            self.update_labels()
-            self.update_waves()
-            self.wave_factory.prepare_drawing_data()
-            time.sleep(0.01)
+    def _on_tick(self, area, frame_clock):
+        if self._frame_ready:
+            self._frame_ready = False
+            self._area.queue_draw()
+
+        now = frame_clock.get_frame_time() / 1e6
+        if self._dirty and not self._rendering and now - self._last_request >= 1 / self.fps:
+            self._dirty = False
+            self._rendering = True
+            self._last_request = now
+            self._wake.set()
+
+        if self._dirty or self._rendering or self._frame_ready:
+            return GLib.SOURCE_CONTINUE
+        tick_id, self._tick_id = self._tick_id, None
+        if self._dirty:
+            self._tick_id = tick_id
+            return GLib.SOURCE_CONTINUE
+        return GLib.SOURCE_REMOVE
 
-    def _start_drawing(self):
+    def _full_update(self):
+        import waves
+        wave_factory = waves.WaveFactory()
+        wave_factory.buffer_size = self.buffer_size
+        wave_factory.y_range = self.y_range
+        wave_factory.y_hysteresis = self.y_hysteresis
+        self.wave_factory = wave_factory
+        renderer = waves.FrameRenderer()
         while True:
-            GObject.idle_add(self._queue_draw, property=GObject.PRIORITY_DEFAULT)
-            time.sleep(0.3)
-
-    def _queue_draw(self):
-        self._area.queue_draw()
-
-
-class WaveFactory:
-
-    buffer_size = 0
-    _waves = []
-    _labels = []
-    _color_counter = 0
-    _label_counter = 0
-
-    colors = [
-        (102, 168, 203),  # dirty blue
-        (224, 56, 44),  # scarlet
-        (41, 155, 73),  # dark mint
-    ]
-
-    def __init__(self):
-        tmp_colors = []
-        for color in self.colors:
-            r, g, b = color
-            tmp_colors.append((r / 255 , g / 255, b / 255))
-        self.colors = tmp_colors
-
-    def reset(self):
-        self._waves = []
-        self._labels = []
-        self._color_counter = 0
-        self._label_counter = 0
-
-    def get_next_color(self):
-        color = self.colors[self._color_counter]
-        self._color_counter += 1
-        if self._color_counter == len(self.colors):
-            self._color_counter = 0
-        return color
-
-    def get_next_label(self):
-        if self._labels and self._label_counter < len(self._labels):
-            title = self._labels[self._label_counter]
-            self._label_counter += 1
-            return title
-        return None
-
-    def create_wave(self):
-        wave = Wave(self.buffer_size, self.get_next_color(), self.get_next_label())
-        self._waves.append(wave)
-        return wave
-
-    def create_label(self, title):
-        self._labels.append(title)
-
-    def get_wave(self, index):
-        return self._waves[index]
-
-    def get_waves(self):
-        return self._waves
-
-    def get_count_waves(self):
-        return len(self._waves)
-
-    def calculate_drawing_data(self):
-        _max_y, _min_y = ([], [])
-        for wave in self._waves:
-            buff = list(filter(lambda i: i is not None, wave.get_buff()))
-            wave.set_buff_with_data(buff)
-
-            if not buff:
-                continue
-
-            max_y = max(buff)
-            min_y = min(buff)
-
-            if min_y < 0:
-                max_y += -min_y
-
-            space = max_y / 10  # top and bottom space percent
-            _max_y.append(max_y + space)
-            _min_y.append(min_y - (space / 2))
-
-        if _max_y and _min_y:
-            return max(_max_y), min(_min_y)
-        return 0, 0
-
-    def prepare_drawing_data(self):
-        max_y, min_y = self.calculate_drawing_data()
-        for wave in self._waves:
-            if max_y == 0:
-                continue
-            wave.prepare_drawing_data(max_y, min_y)
-
-    def draw(self, ctx):
-        label_y_offset = 0
-        for wave in self._waves:
-            wave.draw(ctx)
-            wave.draw_label(ctx, label_y_offset)
-            label_y_offset += 1
-
-
-class Wave:
-    def __init__(self, size, color, label):
-        self._size = size
-        self._buff = [None] * size
-        self._buff_with_data = []
-        self._index = 0
-        self._color = color
-        if label is not None:
-            self._label = label.strip()
-        else:
-            self._label = None
-
-    def put(self, value):
-        self._buff[self._index] = value
-        if self._index == self._size - 1:
-            for _i in range(0, self._size - 1):
-                self._buff[_i] = self._buff[_i+1]
-            self._buff[self._index] = None
-        else:
-            self._index += 1
-
-    def get_buff(self):
-        return self._buff
-
-    def set_buff_with_data(self, buff):
-        self._buff_with_data = buff
-
-    def get_color(self):
-        return self._color
-
-    coordinates = []
-    y_peaks_positive_coordinates = []  # координаты положительных вершины синусоиды
-    y_peaks_negative_coordinates = []  # координаты отрицательных вершины синусоиды
-
-    def prepare_drawing_data(self, max_y, min_y):
-        if not self._buff_with_data:
-            return
-        # вершина синусоиды
-        i = 0
-        y_peaks_positive = []
-        y_peaks_negative = []
-        cnt = len(self._buff_with_data)
-        for y in self._buff_with_data:
-            if i - 1 > 0 and i + 1 < cnt:
-                left = self._buff_with_data[i - 1]
-                right = self._buff_with_data[i + 1]
-                if y > left and y > right:
-                    y_peaks_positive.append(y)
-                if y < left and y < right:
-                    y_peaks_negative.append(y)
-            i += 1
-
-        x = 1
-        self.coordinates = []
-        self.y_peaks_positive_coordinates = []  # координаты положительных вершины синусоиды
-        self.y_peaks_negative_coordinates = []  # координаты отрицательных вершины синусоиды
-        for y in self._buff_with_data:
-            coordinate = (x / self._size), ((y - min_y) / max_y)
-            if y in y_peaks_positive:
-                self.y_peaks_positive_coordinates.append(coordinate)
-            if y in y_peaks_negative:
-                self.y_peaks_negative_coordinates.append(coordinate)
-            self.coordinates.append(coordinate)
-            x += 1
-
-    def draw(self, ctx):
-        if not self.coordinates:
-            return
-
-        ctx.set_source_rgb(*self._color)
-        ctx.set_line_width(.002)
-        ctx.set_dash([])
-
-        x, y = self.coordinates[0]
-        ctx.move_to(x, 1-y)
-
-        for x, y in self.coordinates:
-            ctx.line_to(x, 1-y)
-        ctx.stroke()
-
-        # вывод кружков на положительной вершине синусоиды
-        for x, y in self.y_peaks_positive_coordinates:
-            ctx.arc(x, 1-y, 0.005,  0, 2*math.pi)
-            ctx.fill()
-            ctx.stroke()
-
-        # вывод кружков на отрицательной вершине синусоиды
-        for x, y in self.y_peaks_negative_coordinates:
-            ctx.arc(x, 1 - y, 0.005, 0, 2 * math.pi)
-            ctx.fill()
-            ctx.stroke()
-
-    def draw_label(self, ctx, y_offset):
-        if self._label is None:
-            return
-        y_offset_rec = 0.01
-        y_offset_text = 0.03
-        for i in range(y_offset):
-            y_offset_rec += 0.03
-            y_offset_text += 0.03
-
-        ctx.rectangle(0.01, y_offset_rec, 0.02, 0.02)
-        ctx.set_source_rgb(*self._color)
-        ctx.fill()
-        ctx.stroke()
-
-        ctx.set_source_rgb(0,0,0)
-        ctx.set_font_size(0.025)
-        ctx.select_font_face("Arial", cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_NORMAL)
-        ctx.move_to(0.04, y_offset_text)
-        ctx.show_text(self._label)
-
-        ctx.stroke()
+            self._wake.wait()
+            self._wake.clear()
+            try:
+                if self._reset_requested:
+                    self._reset_requested = False
+                    self.wave_factory.reset()
+                    self._wave_labels_created = False
+                self.update_labels()
+                self.update_waves()
+                width, height = self._width, self._height
+                self.wave_factory.prepare_drawing_data(width)
+                if width > 0 and height > 0:
+                    self._frame_surface = renderer.render(self.wave_factory.frame, width, height)
+                    self._frame_ready = True
+            except Exception:
+                # a bad frame is skipped, the next data is drawn again
+                traceback.print_exc()
+            finally:
+                # _on_tick requests the next frame only while this is False
+                self._rendering = False
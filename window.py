@@ -0,0 +1,92 @@
+import gi
+import time
+import widgets, stream, generator, recorder
+gi.require_version("Gtk", "3.0")
+from gi.repository import Gtk, GLib
+
+
+class RS232Monitor(Gtk.Window):
+    # one port at a time (self.device, picked in the ConnectionWidget);
+    # several ports are read by headless.HeadlessMonitor only
+
+    def __init__(self, record_path=None, fps=30, generator_rate=None, buffer_size=200,
+                 y_range=None, y_hysteresis=0.0, replay_path=None, replay_speed=1.0):
+        super().__init__(title="RS232 Monitor")
+        self.connect("destroy", Gtk.main_quit)
+        self.set_default_size(1000, 600)
+
+        if replay_path is not None:
+            # a capture of record_path played back, the port is the file
+            self.device = recorder.ReplayPort(replay_path, replay_speed)
+        else:
+            # synthetic device: the port is the waveform, the line rate is
+            # generator_rate or else set by the baud rate
+            self.device = generator.GeneratorPort(channels=2, rate=generator_rate)
+
+        self.reader = stream.StreamReader(bulk=True)
+        self.parser = stream.StreamParser()
+
+        self.display = widgets.DisplayWidget()
+        self.plotter = widgets.PlotterWidget(fps, buffer_size, y_range, y_hysteresis)
+        self.connection = widgets.ConnectionWidget(self.device)
+
+        # reader (parser to reader)
+        self.reader.connect('read_message', self.parser.parse_chunk)
+        # read errors go to the display, not into the line state of the parser
+        self.reader.connect('read_error', self.display.out_full_line, is_gobject=True)
+
+        # handed over to the main loop by stream.main_loop_dispatcher, in
+        # batches at most once per frame
+        self.parser.connect('read_floats', self.plotter.on_read_floats, is_gobject=True)
+        self.parser.connect('read_lines', self.plotter.on_read_lines, is_gobject=True)
+        self.parser.connect('read_channels', self.plotter.on_read_channels, is_gobject=True)
+        self.parser.connect('read_lines', self.display.out_lines, is_gobject=True)
+
+        # raw capture of every connection, the path may have strftime() codes
+        self.record_path = record_path
+        self.recorder = None
+
+        # connection
+        self.connection.on_connected = self.on_connected
+        self.connection.on_disconnected = self.on_disconnected
+        self.connection.on_error = self.on_connection_error
+
+        box = Gtk.Box()
+        box.pack_start(self.display, True, True, 5)
+        grid = Gtk.Grid()
+        grid.attach(self.connection, 0, 0, 2, 1)
+        grid.attach(box, 0, 1, 1, 1)
+        grid.attach(self.plotter, 1, 1, 1, 1)
+        self.add(grid)
+        self.show_all()
+        # the plot (numpy, cairo) is loaded after the first frame
+        GLib.idle_add(self.plotter.start_drawing, priority=GLib.PRIORITY_LOW)
+
+    def on_connected(self, read_stream):
+        if self.record_path is not None:
+            session = recorder.SessionRecorder(time.strftime(self.record_path))
+            try:
+                session.start()
+            except OSError as err:
+                # the port is read anyway, without the capture
+                self.display.out_full_line('not recording: {}'.format(err))
+            else:
+                self.recorder = session
+                read_stream = recorder.RecordingStream(read_stream, self.recorder)
+        self.reader.start(read_stream)
+
+    def on_disconnected(self):
+        self.reader.stop()
+        if self.recorder is not None:
+            self.recorder.stop()
+            if self.recorder.report() is not None:
+                self.display.out_full_line(self.recorder.report())
+            self.recorder = None
+
+    def on_connection_error(self, err):
+        # show error message on display
+        msg = stream.StreamMessage()
+        msg.close_stream_after_read = True
+        msg.set_msg(str(err) + '\n')
+        self.reader.start(msg)
+